@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import calendar
+import datetime
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import generate_ledger
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(REPO_DIR, "server.py")
+# Share of requests per kind; queries and summaries read one month, the
+# newest in the synthetic ledger unless --month says otherwise
+MIX = {"add": 0.6, "query": 0.2, "summary": 0.15, "breakdown": 0.05}
+CATEGORIES = list(generate_ledger.CATEGORIES)
+
+
+def build_request(kind, rng, month):
+    if kind == "add":
+        body = json.dumps({"amount": rng.randint(100, 5000),
+                           "category": rng.choice(CATEGORIES)}).encode()
+        return "POST", "/expenses", body
+    if kind == "query":
+        year, number = map(int, month.split("-"))
+        last_day = calendar.monthrange(year, number)[1]
+        return "GET", f"/expenses?start={month}-01&end={month}-{last_day:02d}", b""
+    if kind == "summary":
+        return "GET", f"/summary?month={month}", b""
+    return "GET", "/breakdown", b""
+
+
+# YYYY-MM of the newest expense in a ledger file, or of today when it is empty
+def newest_month(path):
+    with open(path, mode="r", encoding="utf-8") as file:
+        newest = max((row["date"] for row in json.load(file)), default=None)
+    return newest[:7] if newest else datetime.date.today().strftime("%Y-%m")
+
+
+async def send(reader, writer, method, path, body):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+# One keep-alive connection sending requests back to back until the deadline
+async def client(host, port, month, deadline, seed, latencies, failures):
+    rng = random.Random(seed)
+    kinds, weights = list(MIX), list(MIX.values())
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            start = time.perf_counter()
+            status, _ = await send(reader, writer, *build_request(kind, rng, month))
+            latencies[kind].append(time.perf_counter() - start)
+            if status >= 400:
+                failures[kind] += 1
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, month, connections, duration):
+    latencies = {kind: [] for kind in MIX}
+    failures = dict.fromkeys(MIX, 0)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, month, start + duration, seed,
+                                  latencies, failures) for seed in range(connections)))
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection(host, port)
+    _, stats = await send(reader, writer, "GET", "/stats", b"")
+    writer.close()
+    return latencies, failures, elapsed, json.loads(stats)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(latencies, failures, elapsed, stats, connections):
+    total = sum(map(len, latencies.values()))
+    print(f"{total:,} requests over {connections} connections in {elapsed:.1f}s: "
+          f"{total / elapsed:,.0f} req/s")
+    print(f"  {'kind':<10} {'count':>8} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}")
+    for kind, values in [*latencies.items(),
+                         ("all", [v for vs in latencies.values() for v in vs])]:
+        if not values:
+            continue
+        failed = failures.get(kind, sum(failures.values()))
+        print(f"  {kind:<10} {len(values):>8,} {statistics.median(values) * 1000:9.2f} "
+              f"{percentile(values, 0.99) * 1000:9.2f} {failed:>7}")
+    if stats["batches"]:
+        print(f"  {stats['written']:,} expenses written in {stats['batches']:,} batches "
+              f"({stats['written'] / stats['batches']:.1f} per write)")
+    return 1 if any(failures.values()) else 0
+
+
+# Start server.py in the scratch directory holding the synthetic ledger, and
+# wait for it to say it is listening
+def start_server(work_dir, port, backend):
+    env = dict(os.environ, EXPENSE_STORAGE=backend)
+    process = subprocess.Popen([sys.executable, SERVER, "--port", str(port)],
+                               cwd=work_dir, env=env, stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.startswith("Serving"):
+            # Keep reading, so budget alerts printed later never fill the pipe
+            threading.Thread(target=process.stdout.read, daemon=True).start()
+            return process
+    raise RuntimeError(f"server exited with status {process.wait()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Drive server.py on localhost and report req/s and p99 latency")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--size", type=int, default=10000,
+                        help="expenses in the synthetic ledger (default: 10000)")
+    parser.add_argument("--backend", default=os.environ.get("EXPENSE_STORAGE", "json"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--external", action="store_true",
+                        help="test a server already running on --host/--port")
+    parser.add_argument("--month", help="YYYY-MM the reads cover (default: the "
+                                        "newest month of the synthetic ledger, or "
+                                        "the current month with --external)")
+    args = parser.parse_args(argv)
+
+    def load(month):
+        results = asyncio.run(run_load(args.host, args.port, month,
+                                       args.connections, args.duration))
+        return report(*results, args.connections)
+
+    if args.external:
+        return load(args.month or datetime.date.today().strftime("%Y-%m"))
+    with tempfile.TemporaryDirectory() as work_dir:
+        ledger_file = os.path.join(work_dir, "expenses.json")
+        generate_ledger.write_json(ledger_file, args.size)
+        month = args.month or newest_month(ledger_file)
+        server = start_server(work_dir, args.port, args.backend)
+        try:
+            return load(month)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
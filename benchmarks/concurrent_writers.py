@@ -0,0 +1,112 @@
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in each writer process: one load, then interleaved adds, deletes of its
+# own earlier adds and a budget save, each merging the other writers' changes
+CHILD_SCRIPT = """
+import contextlib, io, json, sys
+sys.path.insert(0, sys.argv[1])
+import main
+worker, count = int(sys.argv[2]), int(sys.argv[3])
+added, deleted = [], []
+
+with contextlib.redirect_stdout(io.StringIO()):
+    main.expenses = main.load_expenses()
+    main.rebuild_indexes()
+    for i in range(count):
+        expense = main.new_expense(worker * 1000000 + i, "Food")
+        main.record_expenses([expense])
+        added.append(expense)
+        # Every tenth add, delete this worker's add from nine steps back
+        if i % 10 == 9:
+            with main.storage.locked():
+                victim = main.expenses[added[i - 9].id]
+                main.remove_from_ledger([victim])
+                main.storage.delete_expenses([victim])
+            deleted.append(victim.amount)
+        if i == count // 2:
+            main.monthly_budget[f"Worker {worker}"] = worker
+            main.save_category_budgets()
+    main.storage.close()
+
+print(json.dumps({"added": [e.amount for e in added], "deleted": deleted}))
+"""
+
+# Reads the files back in a fresh process once all writers are done
+CHECK_SCRIPT = """
+import contextlib, io, json, sys
+sys.path.insert(0, sys.argv[1])
+import main
+with contextlib.redirect_stdout(io.StringIO()):
+    loaded = main.open_ledger().load_expenses()
+print(json.dumps({"amounts": [e.amount for e in loaded],
+                  "ids": [e.id for e in loaded],
+                  "budgets": main.load_category_budgets()}))
+"""
+
+
+def run_python(script, work_dir, env, *args):
+    return subprocess.Popen(
+        [sys.executable, "-c", script, REPO_DIR, *map(str, args)],
+        cwd=work_dir, env=env, stdout=subprocess.PIPE, text=True)
+
+
+def result_of(process):
+    stdout, _ = process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"writer exited with status {process.returncode}")
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def main(workers=8, count=200, backend="json"):
+    env = dict(os.environ, EXPENSE_STORAGE=backend)
+    with tempfile.TemporaryDirectory() as work_dir:
+        start = time.perf_counter()
+        processes = [run_python(CHILD_SCRIPT, work_dir, env, worker, count)
+                     for worker in range(1, workers + 1)]
+        results = [result_of(process) for process in processes]
+        elapsed = time.perf_counter() - start
+        final = result_of(run_python(CHECK_SCRIPT, work_dir, env))
+
+    expected = collections.Counter()
+    for result in results:
+        expected.update(result["added"])
+        expected.subtract(result["deleted"])
+    expected = +expected
+    found = collections.Counter(final["amounts"])
+
+    writes = workers * (count + count // 10 + 1)
+    print(f"{workers} writers x {count} adds on the {backend} backend: "
+          f"{writes} writes in {elapsed:.2f}s ({writes / elapsed:,.0f} writes/sec)")
+
+    problems = []
+    if found != expected:
+        problems.append(f"{sum((expected - found).values())} expenses lost, "
+                        f"{sum((found - expected).values())} unexpected")
+    if len(set(final["ids"])) != len(final["ids"]):
+        problems.append("duplicate expense ids")
+    missing_budgets = [f"Worker {worker}" for worker in range(1, workers + 1)
+                       if f"Worker {worker}" not in final["budgets"]]
+    if missing_budgets:
+        problems.append(f"budgets lost: {', '.join(missing_budgets)}")
+
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        return 1
+    print(f"✅ All {sum(expected.values())} expenses and {workers} budgets present")
+    return 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(main(int(args[0]) if len(args) > 0 else 8,
+                  int(args[1]) if len(args) > 1 else 200,
+                  args[2] if len(args) > 2 else "json"))
@@ -0,0 +1,118 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+
+import numpy as np
+
+# Category mix and typical amounts, modelled on the sample ledger: weight,
+# median amount and spread (sigma of the log-normal)
+CATEGORIES = {
+    "Food": (0.38, 900, 0.6),
+    "Transportation": (0.30, 250, 0.4),
+    "Groceries": (0.12, 2800, 0.4),
+    "Entertainment": (0.07, 1500, 1.0),
+    "Shopping": (0.09, 4000, 0.8),
+    "Bills": (0.04, 10000, 0.3),
+}
+# Hour-of-day weights: commutes, lunch and dinner
+HOUR_WEIGHTS = np.array([1, 1, 1, 1, 1, 2, 4, 10, 14, 8, 6, 8,
+                         16, 12, 6, 5, 6, 10, 16, 14, 8, 4, 2, 1], dtype=float)
+# Weekend days (Sat, Sun) see more spending than weekdays
+WEEKDAY_WEIGHTS = np.array([1.0, 1.0, 1.0, 1.0, 1.2, 1.5, 1.4])
+# Most rows use the CSV import key order, as in expenses.json
+ADD_ORDER = ("amount", "category", "date", "id")
+IMPORT_ORDER = ("date", "amount", "category", "id")
+ADD_ORDER_SHARE = 0.15
+# About this many expenses a day, over at most MAX_DAYS; beyond that larger
+# ledgers get denser rather than longer
+PER_DAY = 12
+MAX_DAYS = 5 * 365
+START_DATE = datetime.datetime(2020, 1, 1)
+CHUNK_SIZE = 100000
+
+
+# Yield chunks of (dates, amounts, categories, add_order) arrays, oldest first
+def generate_chunks(count, seed=0, chunk_size=CHUNK_SIZE):
+    rng = np.random.default_rng(seed)
+    names = list(CATEGORIES)
+    weights = np.array([CATEGORIES[name][0] for name in names])
+    medians = np.array([CATEGORIES[name][1] for name in names], dtype=float)
+    sigmas = np.array([CATEGORIES[name][2] for name in names])
+
+    days = min(max(count // PER_DAY, 30), MAX_DAYS)
+    day_weights = WEEKDAY_WEIGHTS[(np.arange(days) + START_DATE.weekday()) % 7]
+    day_weights /= day_weights.sum()
+    # Per-row days, drawn up front so the ledger can be written in date order
+    row_days = np.sort(rng.choice(days, size=count, p=day_weights))
+
+    start_seconds = int((START_DATE - datetime.datetime(1970, 1, 1)).total_seconds())
+    for start in range(0, count, chunk_size):
+        size = min(chunk_size, count - start)
+        codes = rng.choice(len(names), size=size, p=weights / weights.sum())
+        amounts = np.round(medians[codes] * rng.lognormal(0, sigmas[codes]))
+        hours = rng.choice(24, size=size, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+        seconds = (start_seconds + row_days[start:start + size] * 86400
+                   + hours * 3600 + rng.integers(0, 3600, size=size))
+        seconds.sort()
+        dates = np.char.replace(
+            seconds.astype("datetime64[s]").astype(str), "T", " ")
+        add_order = rng.random(size) < ADD_ORDER_SHARE
+        yield dates, amounts, np.array(names)[codes], add_order
+
+
+# Same layout as expenses.json: an indented array of records with ids
+def write_json(path, count, seed=0):
+    next_id = 1
+    with open(path, mode="w", encoding="utf-8") as file:
+        file.write("[\n" if count else "[]")
+        separator = ""
+        for dates, amounts, categories, add_order in generate_chunks(count, seed):
+            records = []
+            for date, amount, category, is_add in zip(
+                    dates.tolist(), amounts.tolist(), categories.tolist(),
+                    add_order.tolist()):
+                values = {"amount": amount, "category": category, "date": date,
+                          "id": next_id}
+                next_id += 1
+                records.append("    {\n" + ",\n".join(
+                    f"        {json.dumps(field)}: {json.dumps(values[field])}"
+                    for field in (ADD_ORDER if is_add else IMPORT_ORDER)) + "\n    }")
+            file.write(separator + ",\n".join(records))
+            separator = ",\n"
+        if count:
+            file.write("\n]")
+
+
+# Same layout as expenses_export.csv: date,amount,category with a header row
+def write_csv(path, count, seed=0):
+    with open(path, mode="w", encoding="utf-8", newline="") as file:
+        file.write("date,amount,category")
+        for dates, amounts, categories, _ in generate_chunks(count, seed):
+            file.write("".join(
+                f"\n{date},{amount},{category}" for date, amount, category in zip(
+                    dates.tolist(), amounts.tolist(), categories.tolist())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic ledger as expenses.json and expenses_export.csv")
+    parser.add_argument("count", type=int, help="number of expenses, e.g. 10000")
+    parser.add_argument("out_dir", nargs="?", default=".")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=("json", "csv", "both"), default="both")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    if args.format in ("json", "both"):
+        write_json(os.path.join(args.out_dir, "expenses.json"), args.count, args.seed)
+    if args.format in ("csv", "both"):
+        write_csv(os.path.join(args.out_dir, "expenses_export.csv"), args.count,
+                  args.seed)
+    print(f"Wrote {args.count} expenses to {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
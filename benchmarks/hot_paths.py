@@ -0,0 +1,179 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import generate_ledger
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [10000, 100000]
+# Calls per measurement for operations too quick to time one at a time
+QUICK_CALLS = 1000
+ADD_CALLS = 100
+
+
+# Time func over repeat runs of calls each; seconds per call
+def measure(results, name, func, repeat, calls=1):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        runs.append((time.perf_counter() - start) / calls)
+    results[name] = {"best": min(runs), "mean": statistics.fmean(runs),
+                     "runs": repeat, "calls": calls}
+
+
+# Runs in a fresh interpreter inside the directory holding the generated
+# ledger, since main opens its storage in the working directory on first use
+def run_worker(repeat):
+    sys.path.insert(0, REPO_DIR)
+    import builtins
+    import main
+
+    builtins.input = lambda prompt="": "y"
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        measure(results, "load_expenses",
+                lambda: setattr(main, "expenses", main.load_expenses()), repeat)
+        measure(results, "rebuild_indexes", main.rebuild_indexes, repeat)
+        measure(results, "save_expenses", main.save_expenses, repeat)
+
+        # Queries are anchored on the newest expense, as the ledger is synthetic
+        now = main.date_records[-1].timestamp
+        year, month = now.year, now.month
+        range_start = (now - datetime.timedelta(days=365)).date()
+        measure(results, "get_monthly_total",
+                lambda: main.get_monthly_total("Food"), repeat, QUICK_CALLS)
+        measure(results, "show_monthly_summary", main.show_monthly_summary, repeat)
+        for period in ("week", "month"):
+            measure(results, f"filter_{period}",
+                    lambda: main.query_expenses_by_date(period, now=now), repeat)
+        measure(results, "filter_range",
+                lambda: main.query_expenses_by_date("range", range_start, now.date()),
+                repeat)
+
+        def build_columns():
+            main.invalidate_expense_columns()
+            main.get_expense_columns()
+
+        measure(results, "build_columns", build_columns, repeat)
+        for granularity in ("daily", "weekly", "monthly"):
+            measure(results, f"trend_{granularity}",
+                    lambda: main.get_expense_columns().period_totals(granularity),
+                    repeat)
+
+        def calendar_month():
+            main.calendar_cache.clear()
+            main.get_calendar_month(year, month)
+
+        measure(results, "calendar_month", calendar_month, repeat)
+        measure(results, "export_csv",
+                lambda: main.export_expenses("bench_export.csv"), repeat)
+        measure(results, "export_ndjson_gz",
+                lambda: main.export_expenses("bench_export.ndjson.gz"), repeat)
+
+        # Mutating paths last: they grow the ledger
+        measure(results, "add_expense",
+                lambda: main.add_expense(100.0, "Food"), 1, ADD_CALLS)
+        measure(results, "import_csv",
+                lambda: main.import_expenses_from_csv("import.csv"), 1)
+        main.storage.close()
+
+    print(json.dumps(results))
+
+
+def run_size(size, repeat, backend):
+    with tempfile.TemporaryDirectory() as work_dir:
+        generate_ledger.write_json(os.path.join(work_dir, "expenses.json"), size)
+        # A different seed, so the import adds rows rather than skipping them
+        generate_ledger.write_csv(os.path.join(work_dir, "import.csv"), size, seed=1)
+        env = dict(os.environ, EXPENSE_STORAGE=backend)
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", "--repeat",
+             str(repeat)],
+            cwd=work_dir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print per-call times, with the ratio to a previous results file if given;
+# returns the operations slower than tolerance allows
+def report(results, baseline=None, tolerance=0.1):
+    regressions = []
+    for size, timings in results["sizes"].items():
+        print(f"\n{int(size):,} expenses ({results['backend']} backend), best per call:")
+        previous = (baseline or {}).get("sizes", {}).get(size, {})
+        for name, timing in timings.items():
+            line = f"  {name:<22} {timing['best'] * 1000:12.3f} ms"
+            if name in previous:
+                ratio = timing["best"] / previous[name]["best"]
+                line += f"  x{ratio:5.2f}"
+                if ratio > 1 + tolerance:
+                    line += "  ❌ slower"
+                    regressions.append(f"{size}/{name}")
+            print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the hot paths on synthetic ledgers")
+    parser.add_argument("sizes", type=int, nargs="*", default=DEFAULT_SIZES,
+                        help="ledger sizes to generate (default: 10000 100000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", default=os.environ.get("EXPENSE_STORAGE", "json"))
+    parser.add_argument("--output", default="hot_paths_results.json",
+                        help="where to write the machine-readable results")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed slowdown against --compare (default: 0.1)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.repeat)
+        return 0
+
+    results = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "repeat": args.repeat,
+        "sizes": {str(size): run_size(size, args.repeat, args.backend)
+                  for size in args.sizes},
+    }
+    with open(args.output, mode="w", encoding="utf-8") as file:
+        json.dump(results, file, indent=4)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, mode="r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    regressions = report(results, baseline, args.tolerance)
+    print(f"\nResults written to {args.output}")
+    if regressions:
+        print(f"❌ Slower than {args.compare}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_FILES = ["expenses.json", "category_budgets.json"]
+HEAVY_MODULES = ["matplotlib", "seaborn", "pandas"]
+
+# Runs in a fresh interpreter: import main, then time the core add/show/summary
+# paths and report which heavy modules ended up loaded
+CHILD_SCRIPT = """
+import builtins, contextlib, io, json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+timings = {"import": time.perf_counter() - start}
+# Confirm any prompt, but leave the paginated list after its first page
+builtins.input = lambda prompt="": "" if "Enter to return" in prompt else "y"
+
+with contextlib.redirect_stdout(io.StringIO()):
+    t = time.perf_counter()
+    main.expenses = main.load_expenses()
+    main.rebuild_indexes()
+    timings["load"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    main.add_expense(100.0, "Food")
+    timings["add"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    main.show_expenses()
+    timings["show"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    main.show_monthly_summary()
+    timings["summary"] = time.perf_counter() - t
+
+timings["total"] = time.perf_counter() - start
+heavy = [name for name in sys.argv[2:] if name in sys.modules]
+print(json.dumps({"timings": timings, "loaded": heavy}))
+"""
+
+
+# Run one cold start in a scratch copy of the ledger so the real files are untouched
+def run_once(work_dir):
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, REPO_DIR, *HEAVY_MODULES],
+        cwd=work_dir, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(runs=5):
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in DATA_FILES:
+            source = os.path.join(REPO_DIR, name)
+            if os.path.exists(source):
+                shutil.copy(source, work_dir)
+
+        results = [run_once(work_dir) for _ in range(runs)]
+
+    print(f"Cold start over {runs} runs (best / worst, ms):")
+    for key in results[0]["timings"]:
+        values = [r["timings"][key] * 1000 for r in results]
+        print(f"  {key:<8} {min(values):8.1f} / {max(values):8.1f}")
+
+    loaded = sorted({name for r in results for name in r["loaded"]})
+    if loaded:
+        print(f"❌ Heavy modules loaded on the core path: {', '.join(loaded)}")
+        return 1
+    print(f"✅ None of {', '.join(HEAVY_MODULES)} loaded on the core path")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
@@ -1,48 +1,1958 @@
+import argparse
+import atexit
+import bisect
 import datetime
 import json
+import math
+import mmap
 import difflib
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from collections import defaultdict
-import seaborn as sns
-import pandas as pd
+import functools
+import gc
+import glob
+import gzip
+import hashlib
+import itertools
+from collections import Counter, OrderedDict, defaultdict
 import calendar
+import concurrent.futures
+import contextlib
 import numpy as np
 import csv
+import os
+import shutil
+import sys
+import time
+import sqlite3
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+EXPENSES_FILE = "expenses.json"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+JOURNAL_FILE = "expenses_journal.jsonl"
+# Snapshot and journal of the binary backend (EXPENSE_STORAGE=binary)
+LEDGER_BINARY_FILE = "expenses.bin"
+BINARY_JOURNAL_FILE = "expenses_bin_journal.jsonl"
+# One JSON file per month plus a manifest of their totals (EXPENSE_STORAGE=partitioned)
+PARTITIONS_DIR = "expenses_partitions"
+PARTITION_MANIFEST = "manifest.json"
+# Month partitions kept in memory before the least recently used are dropped
+PARTITION_CACHE_SIZE = 12
+# Charts rendered without a window, kept until the directory outgrows the limit
+CHART_CACHE_DIR = "chart_cache"
+CHART_CACHE_BYTES = 64 << 20
+CHART_KINDS = ("breakdown", "trend", "calendar")
+CHART_FORMATS = ("png", "svg")
+# Fractions of a category's monthly budget that raise an alert when spending
+# crosses them, e.g. EXPENSE_ALERT_LEVELS=0.5,0.9,1,1.5; EXPENSE_ALERT_LOG=path
+# also appends every alert to a JSON-lines file
+ALERT_LEVELS_ENV = "EXPENSE_ALERT_LEVELS"
+ALERT_LOG_ENV = "EXPENSE_ALERT_LOG"
+BUDGET_ALERT_LEVELS = (0.9, 1.0)
+# The journal is folded into the snapshot once it holds JOURNAL_COMPACT_RATIO
+# times as many records as the snapshot, and at least JOURNAL_COMPACT_THRESHOLD.
+# A compaction rewrites the N snapshot records after at least N / 4 appends, so
+# each journalled change costs at most five record writes amortised whatever
+# the ledger size, and replaying the journal on load stays within a quarter of
+# reading the snapshot.
+JOURNAL_COMPACT_THRESHOLD = 500
+JOURNAL_COMPACT_RATIO = 0.25
+BUDGETS_FILE = "category_budgets.json"
+DELETED_FILE = "deleted_expenses.json"
+# Append-only deletion log; replaces the rewrite-on-every-delete DELETED_FILE
+DELETED_LOG_FILE = "deleted_expenses.jsonl"
+# Deleted expenses older than this are dropped when the log is compacted
+DELETED_RETENTION_DAYS = 90
+RESTORE_BATCHES_SHOWN = 10
+# Rows per page in the expense list views
+PAGE_SIZE = 20
+# Rows parsed per batch when streaming a CSV import
+IMPORT_CHUNK_SIZE = 5000
+MAX_REPORTED_ROW_ERRORS = 10
+# Categories sharing the most trigrams with a typed name that get scored
+SUGGESTION_CANDIDATES = 10
+# Rows formatted per write and the file buffer size used by exports
+EXPORT_BATCH_SIZE = 10000
+EXPORT_BUFFER_SIZE = 1 << 20
+SQLITE_FILE = "expenses.db"
+# Seconds a SQLite write waits for another connection to finish
+SQLITE_BUSY_TIMEOUT = 30
+# Advisory lock serialising writers of the JSON files across processes
+LOCK_FILE = "expenses.lock"
+DEFAULT_BUDGETS = {
+    "Transportation": 10000,
+    "Groceries": 30000,
+    "Entertainment": 5000
+}
+
+# Key orders used by expenses.json: added expenses and CSV imports differ,
+# and saves must reproduce the file exactly
+ADD_FIELDS = ("amount", "category", "date", "id")
+IMPORT_FIELDS = ("date", "amount", "category", "id")
+field_orders = {ADD_FIELDS: ADD_FIELDS, IMPORT_FIELDS: IMPORT_FIELDS}
+EXPENSE_FIELDS = frozenset(ADD_FIELDS)
+
+# Opt-in instrumentation, e.g. EXPENSE_PROFILE=timing or --profile
+# timing,cprofile,tracemalloc. The session's numbers are written to
+# PROFILE_FILE on exit and printed by "python main.py profile".
+PROFILE_ENV = "EXPENSE_PROFILE"
+PROFILE_MODES = ("timing", "cprofile", "tracemalloc")
+PROFILE_FILE = "expense_profile.json"
+PROFILE_STATS_FILE = "expense_profile.prof"
+PROFILE_REPORT_LIMIT = 15
+# Active modes; empty unless profiling was asked for
+profiling = set()
+# Per instrumented function: calls, total seconds, slowest call, rows scanned
+profile_stats = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "max": 0.0, "rows": 0})
+profiler = None
+
+
+# Record wall time and calls of func while profiling; rows(result, *args) gives
+# the rows a call scanned. Times include nested instrumented calls, and for the
+# charts the time the window stayed open.
+def instrumented(rows=None):
+    def decorate(func):
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiling:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stats = profile_stats[name]
+                stats["calls"] += 1
+                stats["seconds"] += elapsed
+                stats["max"] = max(stats["max"], elapsed)
+            if rows is not None:
+                stats["rows"] += rows(result, *args)
+            return result
+        return wrapper
+    return decorate
+
+
+# Parse "timing,cprofile"-style mode lists; any mode implies timing
+def profile_modes(text):
+    modes = {mode.strip().lower() for mode in text.split(",") if mode.strip()}
+    if not modes or modes <= {"0", "off", "false"}:
+        return set()
+    if modes <= {"1", "on", "true"}:
+        return {"timing"}
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        raise ValueError(f"unknown profile mode(s): {', '.join(sorted(unknown))}; "
+                         f"use {', '.join(PROFILE_MODES)}")
+    return modes | {"timing"}
+
+
+# Modes asked for by EXPENSE_PROFILE; an unusable value is reported and
+# leaves profiling off rather than failing the import
+def env_profile_modes():
+    try:
+        return profile_modes(os.environ.get(PROFILE_ENV, ""))
+    except ValueError as error:
+        print(f"Warning: ignoring {PROFILE_ENV}: {error}", file=sys.stderr)
+        return set()
 
 
-# Read existing expenses from JSON file
-def load_expenses():
+def start_profiling(modes):
+    global profiler
+    new_modes = modes - profiling
+    if not new_modes:
+        return
+    if not profiling:
+        atexit.register(finish_profiling)
+    profiling.update(new_modes)
+    if "cprofile" in new_modes:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if "tracemalloc" in new_modes:
+        import tracemalloc
+        tracemalloc.start()
+
+
+# Write the session's numbers to PROFILE_FILE (and the cProfile stats beside it)
+def finish_profiling():
+    global profiler
+    if not profiling:
+        return
+    result = {
+        "created": datetime.datetime.now().strftime(DATE_FORMAT),
+        "modes": sorted(profiling),
+        "functions": dict(profile_stats),
+        "cprofile": None,
+        "memory": None,
+    }
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(PROFILE_STATS_FILE)
+        result["cprofile"] = PROFILE_STATS_FILE
+        profiler = None
+    if "tracemalloc" in profiling:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:PROFILE_REPORT_LIMIT]
+            tracemalloc.stop()
+            result["memory"] = {"current": current, "peak": peak,
+                                "top": [str(stat) for stat in top]}
+    with open(PROFILE_FILE, mode="w", encoding="utf-8") as file:
+        json.dump(result, file, indent=4)
+    profiling.clear()
+    print(f"Profile written to {PROFILE_FILE}; run 'python main.py profile' "
+          f"to see the top offenders.", file=sys.stderr)
+
+
+# Print the slowest instrumented functions of the last profiled session, then
+# the cProfile and tracemalloc captures when they were taken
+def print_profile_report(report, limit=PROFILE_REPORT_LIMIT):
+    functions = sorted(report["functions"].items(),
+                       key=lambda item: item[1]["seconds"], reverse=True)[:limit]
+    print(f"Profile of {report['created']} ({', '.join(report['modes'])}), "
+          f"top {len(functions)} by total time:")
+    print(f"  {'function':<36} {'calls':>7} {'total ms':>11} {'mean ms':>10} "
+          f"{'max ms':>10} {'rows':>10}")
+    for name, stats in functions:
+        print(f"  {name:<36} {stats['calls']:>7} {stats['seconds'] * 1000:>11.2f} "
+              f"{stats['seconds'] * 1000 / stats['calls']:>10.3f} "
+              f"{stats['max'] * 1000:>10.2f} {stats['rows']:>10}")
+
+    if report["cprofile"] and os.path.exists(report["cprofile"]):
+        import pstats
+        print("\ncProfile, by cumulative time:")
+        pstats.Stats(report["cprofile"], stream=sys.stdout).strip_dirs() \
+            .sort_stats("cumulative").print_stats(limit)
+    if report["memory"]:
+        memory = report["memory"]
+        print(f"\nMemory: {memory['current'] / 1e6:.1f} MB at exit, "
+              f"{memory['peak'] / 1e6:.1f} MB peak. Largest allocation sites:")
+        for line in memory["top"]:
+            print(f"  {line}")
+
+
+# Parse a "%Y-%m-%d %H:%M:%S" date. fromisoformat is much faster than strptime,
+# so it is used whenever the string has exactly that layout.
+def parse_timestamp(date):
+    if len(date) == 19 and date[4] == "-" and date[7] == "-" and date[10] == " ":
+        try:
+            parsed = datetime.datetime.fromisoformat(date)
+        except ValueError:
+            parsed = None
+        if parsed is not None and parsed.tzinfo is None:
+            return parsed
+    return datetime.datetime.strptime(date, DATE_FORMAT)
+
+
+# A single expense, with its date parsed once when the record is created.
+# Keys other than EXPENSE_FIELDS are kept in extra and written back unchanged.
+class Expense:
+    __slots__ = ("amount", "category", "date", "timestamp", "fields", "id", "extra")
+
+    def __init__(self, amount, category, date, timestamp=None, fields=ADD_FIELDS,
+                 id=None, extra=None):
+        self.amount = amount
+        self.category = category
+        self.date = date
+        self.timestamp = timestamp or parse_timestamp(date)
+        self.fields = fields
+        # Persistent id, unique within the ledger
+        self.id = id
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        fields = tuple(data)
+        extra = None
+        if not EXPENSE_FIELDS.issuperset(fields):
+            extra = {field: data[field] for field in fields
+                     if field not in EXPENSE_FIELDS}
+        return cls(data["amount"], data["category"], data["date"],
+                   fields=field_orders.setdefault(fields, fields),
+                   id=data.get("id"), extra=extra)
+
+    # Records written before expenses had ids gain an "id" key at the end
+    def set_id(self, expense_id):
+        self.id = expense_id
+        if "id" not in self.fields:
+            fields = self.fields + ("id",)
+            self.fields = field_orders.setdefault(fields, fields)
+
+    def to_dict(self):
+        if self.extra is None:
+            return {field: getattr(self, field) for field in self.fields}
+        return {field: self.extra[field] if field in self.extra else getattr(self, field)
+                for field in self.fields}
+
+    def update(self, changes):
+        for field, value in changes.items():
+            setattr(self, field, value)
+        if "date" in changes:
+            self.timestamp = parse_timestamp(self.date)
+
+
+# json.dump(indent=4) always uses the pure-Python encoder. This writes the
+# same bytes, encoding one record at a time from C-accelerated pieces.
+def write_expenses_json(file, records, batch_size=10000):
+    if not records:
+        file.write("[]")
+        return
+    file.write("[\n")
+    for start in range(0, len(records), batch_size):
+        if start:
+            file.write(",\n")
+        file.write(",\n".join(
+            map(encode_expense_json, records[start:start + batch_size])))
+    file.write("\n]")
+
+
+def encode_expense_json(expense):
+    if expense.extra is not None:
+        return encode_record_json(expense.to_dict())
+    return "    {\n" + ",\n".join(
+        f"        {encode_json_string(field)}: {encode_json_scalar(getattr(expense, field))}"
+        for field in expense.fields) + "\n    }"
+
+
+def encode_record_json(record):
+    return "    {\n" + ",\n".join(
+        f"        {encode_json_string(field)}: {encode_json_scalar(value)}"
+        for field, value in record.items()) + "\n    }"
+
+
+encode_json_string = json.encoder.encode_basestring_ascii
+
+
+def encode_json_scalar(value):
+    if isinstance(value, str):
+        return encode_json_string(value)
+    if type(value) is float and math.isfinite(value):
+        return float.__repr__(value)
+    if type(value) is int:
+        return int.__repr__(value)
+    return json.dumps(value)
+
+
+# Binary ledger: LEDGER_MAGIC, the byte length of a JSON header, the header
+# (row count, category dictionary, key orders, column offsets) and then one
+# fixed-width little-endian column per field, each 8-byte aligned so the file
+# can be memory-mapped straight into NumPy arrays
+LEDGER_MAGIC = b"EXPLDG01"
+LEDGER_COLUMNS = (("id", "<i8"), ("timestamp", "<i8"), ("amount", "<f8"),
+                  ("category", "<i4"), ("flags", "<u2"), ("date", "S19"))
+# flags: the low bit marks amounts that are JSON integers, the rest index the
+# header's key orders. Records the columns cannot reproduce byte for byte are
+# kept whole in the header's "exceptions".
+AMOUNT_IS_INT = 1
+MAX_EXACT_INT = 2 ** 53
+
+
+def aligned(offset):
+    return offset + -offset % 8
+
+
+def write_ledger_binary(file, records):
+    categories, orders, exceptions = {}, {}, []
+    ids, timestamps, amounts, codes, flags, dates = [], [], [], [], [], []
+    for row, expense in enumerate(records):
+        amount = expense.amount
+        is_int = type(amount) is int and abs(amount) <= MAX_EXACT_INT
+        exact_date = len(expense.date) == 19 and expense.date.isascii()
+        if not ((is_int or type(amount) is float) and type(expense.id) is int
+                and type(expense.category) is str and exact_date
+                and expense.extra is None):
+            exceptions.append([row, expense.to_dict()])
+        dates.append(expense.date if exact_date else "")
+        ids.append(expense.id if type(expense.id) is int else 0)
+        timestamps.append(to_epoch(expense.timestamp))
+        amounts.append(float(amount))
+        codes.append(categories.setdefault(expense.category, len(categories)))
+        flags.append(orders.setdefault(expense.fields, len(orders)) << 1 | is_int)
+
+    data, offset, column_offsets = [], 0, []
+    for (name, dtype), values in zip(LEDGER_COLUMNS,
+                                     (ids, timestamps, amounts, codes, flags, dates)):
+        column = np.array(values, dtype=dtype).tobytes()
+        column_offsets.append([name, dtype, offset])
+        data.append(column + bytes(aligned(len(column)) - len(column)))
+        offset += aligned(len(column))
+
+    header = json.dumps({"count": len(records), "categories": list(categories),
+                         "field_orders": list(orders), "exceptions": exceptions,
+                         "columns": column_offsets}).encode("utf-8")
+    file.write(LEDGER_MAGIC + len(header).to_bytes(8, "little") + header)
+    file.write(bytes(aligned(len(header)) - len(header)))
+    file.writelines(data)
+
+
+# Map a binary ledger read-only for the duration of the with block; yields its
+# header and column arrays that are views of the mapping, valid only inside
+# the block. The mapping is closed on leaving, so anything kept must be
+# copied out first: Windows cannot replace a file that
+# is still mapped, which would break compaction and conversion.
+@contextlib.contextmanager
+def mapped_ledger(path):
+    with open(path, mode="rb") as file:
+        if file.read(len(LEDGER_MAGIC)) != LEDGER_MAGIC:
+            raise ValueError(f"{path} is not a binary ledger")
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    start = len(LEDGER_MAGIC) + 8
+    header_size = int.from_bytes(mapping[len(LEDGER_MAGIC):start], "little")
+    header = json.loads(mapping[start:start + header_size])
+    data_start = start + aligned(header_size)
+    count = header["count"]
+    columns = {name: np.frombuffer(mapping, dtype, count, data_start + offset)
+                     if count else np.empty(0, dtype)
+               for name, dtype, offset in header["columns"]}
+    try:
+        yield header, columns
+    finally:
+        # Views of the mapping would keep it from closing
+        columns.clear()
+        mapping.close()
+
+
+# Expense objects for a mapped binary ledger, built column-wise
+def expenses_from_binary(header, columns):
+    categories = header["categories"]
+    orders = [field_orders.setdefault(tuple(fields), tuple(fields))
+              for fields in header["field_orders"]]
+    records = [
+        Expense(int(amount) if flag & AMOUNT_IS_INT else amount, categories[code],
+                date, stamp, orders[flag >> 1], expense_id)
+        for expense_id, date, stamp, amount, code, flag in zip(
+            columns["id"].tolist(), columns["date"].astype("U19").tolist(),
+            columns["timestamp"].astype("datetime64[s]").tolist(),
+            columns["amount"].tolist(), columns["category"].tolist(),
+            columns["flags"].tolist())]
+    for row, data in header["exceptions"]:
+        records[row] = Expense.from_dict(data)
+    return records
+
+
+# Wrap a batch of deleted expenses as log entries sharing a batch id and time
+def new_deleted_entries(deleted_items):
+    batch = time.time_ns()
+    deleted_at = datetime.datetime.now().strftime(DATE_FORMAT)
+    return [{"entry": f"{batch}.{i}", "batch": batch, "deleted_at": deleted_at,
+             "expense": expense}
+            for i, expense in enumerate(deleted_items)]
+
+
+# Exclusive advisory lock on a file: flock where available, msvcrt on Windows.
+# Re-entrant within a process, so locked sections can nest.
+class FileLock:
+    def __init__(self, path=LOCK_FILE):
+        self.path = path
+        self.file = None
+        self.depth = 0
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    # Without blocking, returns False rather than wait for another process
+    def acquire(self, blocking=True):
+        if self.depth == 0:
+            file = open(self.path, mode="a+b")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(),
+                                fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                elif msvcrt is not None:
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(),
+                                   msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            except OSError:
+                file.close()
+                if blocking:
+                    raise
+                return False
+            self.file = file
+        self.depth += 1
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()
+            self.file = None
+
+
+# Write a file through a temporary file and a rename, so readers and crashes
+# only ever see the old or the new contents
+@contextlib.contextmanager
+def atomic_write(path, mode="w"):
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, mode=mode,
+                  encoding=None if "b" in mode else "utf-8") as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_file, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_file)
+        raise
+
+
+# Creating one object per expense would otherwise set off collection after
+# collection while nothing can be freed yet
+@contextlib.contextmanager
+def gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
     try:
-        with open("expenses.json", mode="r") as file:
-            return json.load(file)
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# Cut off the partial last line a crash mid-append leaves in an append-only
+# log, so the next record starts on a line of its own instead of being fused
+# to it and lost. Called under the write lock, before appending.
+def trim_partial_line(path, chunk_size=1 << 16):
+    try:
+        file = open(path, mode="r+b")
     except FileNotFoundError:
-        return []
+        return
+    with file:
+        end = position = file.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        file.seek(end - 1)
+        if file.read(1) == b"\n":
+            return
+        while position > 0:
+            start = max(0, position - chunk_size)
+            file.seek(start)
+            newline = file.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        file.truncate(position)
+
+
+# Identifies one version of a file; a rename or rewrite changes it
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+# Returned by storage sync when another process's changes need a full reload
+RELOAD_LEDGER = "reload"
+
+
+# Default backend: the expenses.json snapshot plus an append-only journal of changes.
+# Writers hold LOCK_FILE and first merge in whatever other processes wrote
+# since this one last read the files.
+class JsonStorage:
+    snapshot_file = EXPENSES_FILE
+    journal_file = JOURNAL_FILE
+    # How save_expenses opens and writes snapshot_file
+    snapshot_mode = "w"
+    write_snapshot = staticmethod(write_expenses_json)
+
+    def __init__(self):
+        self.journal_records = 0
+        self.snapshot_records = 0
+        # Snapshot version and journal bytes this process has already seen
+        self.snapshot_stamp = None
+        self.journal_offset = 0
+        self.lock = FileLock()
+        with self.lock:
+            self.migrate_deleted_log()
+
+    # Take the write lock only if it is free, for callers that must not block;
+    # locked() sections inside then join it. Pair with release_lock.
+    def try_lock(self):
+        return self.lock.acquire(blocking=False)
+
+    # Writes are already on disk, so there is nothing to undo on failure
+    def release_lock(self, commit=True):
+        self.lock.release()
+
+    # Hold the write lock with other processes' changes merged into memory
+    @contextlib.contextmanager
+    def locked(self):
+        with self.lock:
+            changes = self.sync()
+            if changes:
+                merge_external_changes(changes)
+            yield
+
+    # Whether other processes have written since this one last read, from
+    # the file stamps alone and without the lock
+    def stale(self):
+        try:
+            size = os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            size = 0
+        return (size != self.journal_offset
+                or file_stamp(self.snapshot_file) != self.snapshot_stamp)
+
+    # Changes written by other processes: the new journal records, or
+    # RELOAD_LEDGER when the snapshot itself was rewritten
+    def sync(self):
+        if file_stamp(self.snapshot_file) != self.snapshot_stamp:
+            return RELOAD_LEDGER
+        try:
+            size = os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            size = 0
+        if size == self.journal_offset:
+            return None
+        if size < self.journal_offset:
+            return RELOAD_LEDGER
+        records = list(self.read_journal(self.journal_offset))
+        self.journal_records += len(records)
+        return records
+
+    # Read existing expenses: the JSON snapshot plus any journalled changes
+    def load_expenses(self):
+        with self.lock:
+            return self.read_ledger()
+
+    def read_ledger(self):
+        self.snapshot_stamp = file_stamp(self.snapshot_file)
+        try:
+            with gc_paused():
+                snapshot = self.read_snapshot()
+        except FileNotFoundError:
+            snapshot = []
+        self.snapshot_records = len(snapshot)
+
+        # Files written before expenses had ids get them once, in ledger order
+        missing = [expense for expense in snapshot if expense.id is None]
+        next_id = max((expense.id for expense in snapshot
+                       if expense.id is not None), default=0) + 1
+        for expense_id, expense in enumerate(missing, start=next_id):
+            expense.set_id(expense_id)
+
+        ledger = {expense.id: expense for expense in snapshot}
+        self.journal_records, positional = self.replay_journal(ledger)
+        if missing or positional:
+            self.rewrite_snapshot(list(ledger.values()))
+        return list(ledger.values())
+
+    def read_snapshot(self):
+        with open(self.snapshot_file, mode="r") as file:
+            return [Expense.from_dict(data) for data in json.load(file)]
+
+    # Apply the records of the append-only journal on top of the snapshot;
+    # returns how many were applied and whether any predate expense ids
+    def replay_journal(self, ledger):
+        applied = 0
+        positional = False
+        for record in self.read_journal(0):
+            positional |= self.apply_journal_record(ledger, record)
+            applied += 1
+        return applied, positional
+
+    # Journal records from a byte offset on, advancing journal_offset past each
+    def read_journal(self, offset):
+        self.journal_offset = offset
+        try:
+            with open(self.journal_file, mode="rb") as file:
+                file.seek(offset)
+                for line in file:
+                    # A crash mid-append can leave a partial last line
+                    if not line.endswith(b"\n"):
+                        break
+                    self.journal_offset += len(line)
+                    # Whole lines that do not parse (a record fused to such a
+                    # partial line by older versions) are skipped
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    yield record
+        except FileNotFoundError:
+            pass
+
+    # Records address expenses by id; journals written before ids existed
+    # address them by list position, which costs a pass over the ledger
+    @staticmethod
+    def apply_journal_record(ledger, record):
+        op = record["op"]
+        if op == "add":
+            expense = Expense.from_dict(record["expense"])
+            if expense.id is None:
+                expense.set_id(max(ledger, default=0) + 1)
+            ledger[expense.id] = expense
+            return "id" not in record["expense"]
+        if op == "edit":
+            expense = Expense.from_dict(record["expense"])
+            if "index" in record:
+                expense.set_id(list(ledger)[record["index"]])
+            ledger[expense.id] = expense
+            return "index" in record
+        if op == "delete":
+            if "indexes" in record:
+                keys = list(ledger)
+                ids = [keys[idx] for idx in record["indexes"]]
+            else:
+                ids = record["ids"]
+            for expense_id in ids:
+                ledger.pop(expense_id, None)
+            return "indexes" in record
+        return False
+
+    # Append change records to the journal instead of rewriting the whole file
+    def append_journal(self, records):
+        if not records:
+            return
+        with self.locked():
+            # A batch that would trigger compaction anyway goes straight into
+            # the snapshot rather than being written twice
+            if self.compact_due(len(records)):
+                self.compact()
+                return
+            data = "".join(json.dumps(record, default=Expense.to_dict) + "\n"
+                           for record in records).encode("utf-8")
+            trim_partial_line(self.journal_file)
+            with open(self.journal_file, mode="ab") as file:
+                file.write(data)
+            self.journal_offset += len(data)
+            self.journal_records += len(records)
+
+    def compact_due(self, new_records):
+        return self.journal_records + new_records >= max(
+            JOURNAL_COMPACT_THRESHOLD, JOURNAL_COMPACT_RATIO * self.snapshot_records)
+
+    def add_expenses(self, new_expenses):
+        self.append_journal([{"op": "add", "expense": expense}
+                             for expense in new_expenses])
+
+    def update_expense(self, expense):
+        self.append_journal([{"op": "edit", "id": expense.id, "expense": expense}])
+
+    def delete_expenses(self, removed):
+        self.append_journal([{"op": "delete",
+                              "ids": [expense.id for expense in removed]}])
+
+    # Save the full expense list as the snapshot
+    def save_expenses(self, all_expenses):
+        with self.lock:
+            with atomic_write(self.snapshot_file, self.snapshot_mode) as file:
+                self.write_snapshot(file, all_expenses)
+            self.snapshot_stamp = file_stamp(self.snapshot_file)
+            self.snapshot_records = len(all_expenses)
+
+    # Fold the journal into a fresh snapshot and start a new, empty journal
+    def compact(self):
+        with self.locked():
+            self.rewrite_snapshot(list(expenses.values()))
+
+    # Replaying the journal again after a crash between these two steps is
+    # harmless, since records address expenses by id
+    def rewrite_snapshot(self, records):
+        with self.lock:
+            self.save_expenses(records)
+            with open(self.journal_file, mode="w", encoding="utf-8"):
+                pass
+            self.journal_offset = 0
+            self.journal_records = 0
+
+    # Short-lived runs (the command line) leave the journal for a later compaction
+    def close(self, compact=True):
+        if compact and self.journal_records:
+            self.compact()
+
+    # Queries are answered from the in-memory indexes
+    def monthly_total(self, category, year, month):
+        return monthly_totals.get((year, month, category.lower()), 0)
+
+    def expenses_between(self, start=None, end=None, include_end=False):
+        return expenses_between(start, end, include_end)
+
+    # Stream expenses without copying: ledger order when unbounded, else by date
+    def iter_expenses(self, start=None, end=None, include_end=False):
+        if start is None and end is None:
+            return iter(expenses.values())
+        lo, hi = date_bounds(start, end, include_end)
+        return itertools.islice(date_records, lo, hi)
+
+    def category_totals(self):
+        return get_expense_columns().category_totals()
+
+    # Every category name the ledger uses
+    def category_names(self):
+        return category_counts.keys()
+
+    # Analytics columns that come with the ledger just loaded, if any
+    def loaded_columns(self, count):
+        return None
+
+    # Backends that load lazily return the expenses now read in and the ids
+    # they dropped; this one always holds everything
+    def ensure_loaded(self, start=None, end=None, include_end=False):
+        return [], []
+
+    # Highest id among expenses that are not loaded
+    def highest_id(self):
+        return 0
+
+    def is_empty(self):
+        return not expenses
+
+    def load_budgets(self):
+        try:
+            with open(BUDGETS_FILE, mode="r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return dict(DEFAULT_BUDGETS)
+
+    def save_budgets(self, budgets):
+        with self.lock, atomic_write(BUDGETS_FILE) as file:
+            json.dump(budgets, file, indent=4)
+
+    # Carry the old single-array deletion log over into the append-only log
+    def migrate_deleted_log(self):
+        if os.path.exists(DELETED_LOG_FILE) or not os.path.exists(DELETED_FILE):
+            return
+        with open(DELETED_FILE, mode="r") as file:
+            legacy = [Expense.from_dict(data) for data in json.load(file)]
+        with atomic_write(DELETED_LOG_FILE) as file:
+            self.write_deleted_records(file, new_deleted_entries(legacy))
+
+    @staticmethod
+    def write_deleted_records(file, records):
+        file.writelines(json.dumps(record, default=Expense.to_dict) + "\n"
+                        for record in records)
+
+    def append_deleted_log(self, records):
+        with self.lock:
+            trim_partial_line(DELETED_LOG_FILE)
+            with open(DELETED_LOG_FILE, mode="a", encoding="utf-8") as file:
+                self.write_deleted_records(file, records)
+
+    # Replay the deletion log; returns live entries and the number of records read
+    def read_deleted_log(self):
+        entries, records = {}, 0
+        try:
+            with open(DELETED_LOG_FILE, mode="r", encoding="utf-8") as file:
+                for line in file:
+                    # Same recovery as read_journal: stop at a partial last
+                    # line, skip whole lines that do not parse
+                    if not line.endswith("\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    records += 1
+                    if "entries" in record:
+                        for entry_id in record["entries"]:
+                            entries.pop(entry_id, None)
+                    else:
+                        record["expense"] = Expense.from_dict(record["expense"])
+                        entries[record["entry"]] = record
+        except FileNotFoundError:
+            pass
+        return list(entries.values()), records
+
+    def load_deleted(self):
+        return self.read_deleted_log()[0]
+
+    # Deletions are appended, so logging does not depend on the size of the log
+    def log_deleted(self, deleted_items):
+        entries = new_deleted_entries(deleted_items)
+        self.append_deleted_log(entries)
+        return entries
+
+    def restore_deleted(self, entry_ids):
+        self.append_deleted_log([{"entries": list(entry_ids)}])
+
+    # Drop restored and expired entries, rewriting the log only if that frees
+    # anything; returns the entries that remain
+    def compact_deleted(self, cutoff):
+        with self.lock:
+            entries, records = self.read_deleted_log()
+            kept = [entry for entry in entries if entry["deleted_at"] >= cutoff]
+            if len(kept) < records:
+                with atomic_write(DELETED_LOG_FILE) as file:
+                    self.write_deleted_records(file, kept)
+        return kept
+
+
+# EXPENSE_STORAGE=binary: the JSON backend with the snapshot kept as fixed-width
+# columns in LEDGER_BINARY_FILE, so loading it skips the JSON parse and hands
+# the analytics a copy of its columns instead of building them from the
+# expenses one by one. It has a journal of its own.
+class BinaryStorage(JsonStorage):
+    snapshot_file = LEDGER_BINARY_FILE
+    journal_file = BINARY_JOURNAL_FILE
+    snapshot_mode = "wb"
+    write_snapshot = staticmethod(write_ledger_binary)
+
+    def __init__(self):
+        # Columns copied out of the snapshot as last read, until taken by
+        # loaded_columns
+        self.columns = None
+        super().__init__()
+        self.migrate_from_json()
+
+    # One-shot conversion of the JSON ledger, journal included
+    def migrate_from_json(self):
+        if os.path.exists(self.snapshot_file) or not os.path.exists(EXPENSES_FILE):
+            return
+        migrated = JsonStorage().load_expenses()
+        self.rewrite_snapshot(migrated)
+        print(f"Migrated {len(migrated)} expenses from {EXPENSES_FILE} "
+              f"into {self.snapshot_file}")
+
+    def read_ledger(self):
+        self.columns = None
+        ledger = super().read_ledger()
+        # Journalled changes leave the snapshot's columns behind the ledger
+        if self.journal_records:
+            self.columns = None
+        return ledger
+
+    def read_snapshot(self):
+        with mapped_ledger(self.snapshot_file) as (header, columns):
+            if header["count"]:
+                self.columns = ExpenseColumns.from_arrays(
+                    columns["timestamp"].copy(), columns["amount"].copy(),
+                    columns["category"].copy(), header["categories"])
+            return expenses_from_binary(header, columns)
+
+    def loaded_columns(self, count):
+        columns, self.columns = self.columns, None
+        if columns is not None and columns.size == count:
+            return columns
+        return None
+
+
+# Partition holding an expense dated at timestamp, e.g. "2025-04"
+def partition_key(timestamp):
+    return f"{timestamp.year:04d}-{timestamp.month:02d}"
+
+
+# Manifest entry for a partition: row count, total and total per category name
+def partition_summary(rows):
+    categories = defaultdict(float)
+    for expense in rows:
+        categories[expense.category] += expense.amount
+    return {"count": len(rows), "total": sum(categories.values()),
+            "categories": dict(categories)}
+
+
+# EXPENSE_STORAGE=partitioned: one file per year-month under PARTITIONS_DIR and
+# a manifest of per-partition totals. Monthly totals come from the manifest;
+# a session starts with only the current month in memory, and other months
+# are read when a query needs them (see ensure_loaded), keeping at most
+# PARTITION_CACHE_SIZE of them once ranged queries move on.
+class PartitionedStorage(JsonStorage):
+    snapshot_file = PARTITIONS_DIR
+
+    def __init__(self):
+        self.manifest_file = os.path.join(PARTITIONS_DIR, PARTITION_MANIFEST)
+        self.manifest = {"next_id": 1, "partitions": {}}
+        self.manifest_stamp = None
+        # Partitions in memory, least recently used first, with their ids
+        self.resident = OrderedDict()
+        # Partition of every expense this process has read or written
+        self.months = {}
+        super().__init__()
+        os.makedirs(PARTITIONS_DIR, exist_ok=True)
+        self.migrate_from_json()
+
+    def migrate_from_json(self):
+        if os.path.exists(self.manifest_file) or not os.path.exists(EXPENSES_FILE):
+            return
+        migrated = JsonStorage().load_expenses()
+        self.save_expenses(migrated)
+        print(f"Migrated {len(migrated)} expenses from {EXPENSES_FILE} "
+              f"into {PARTITIONS_DIR}")
+
+    @contextlib.contextmanager
+    def locked(self):
+        with self.lock:
+            if file_stamp(self.manifest_file) != self.manifest_stamp:
+                merge_external_changes(RELOAD_LEDGER)
+            yield
+
+    def stale(self):
+        return file_stamp(self.manifest_file) != self.manifest_stamp
+
+    def read_manifest(self):
+        self.manifest_stamp = file_stamp(self.manifest_file)
+        try:
+            with open(self.manifest_file, mode="r", encoding="utf-8") as file:
+                self.manifest = json.load(file)
+        except FileNotFoundError:
+            self.manifest = {"next_id": 1, "partitions": {}}
 
+    def write_manifest(self):
+        with atomic_write(self.manifest_file) as file:
+            json.dump(self.manifest, file, indent=4)
+        self.manifest_stamp = file_stamp(self.manifest_file)
 
-# Save expenses to JSON file
+    def partition_file(self, month):
+        return os.path.join(PARTITIONS_DIR, f"{month}.json")
+
+    def read_partition(self, month):
+        try:
+            with open(self.partition_file(month), mode="r") as file, gc_paused():
+                return [Expense.from_dict(data) for data in json.load(file)]
+        except FileNotFoundError:
+            return []
+
+    def write_partition(self, month, rows):
+        if not rows:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.partition_file(month))
+            self.manifest["partitions"].pop(month, None)
+            return
+        with atomic_write(self.partition_file(month)) as file:
+            write_expenses_json(file, rows)
+        self.manifest["partitions"][month] = partition_summary(rows)
+
+    # Read partitions into memory, noting which expenses came from where
+    def load_partitions(self, months):
+        loaded = []
+        for month in months:
+            rows = self.read_partition(month)
+            self.resident[month] = {expense.id for expense in rows}
+            self.months.update((expense.id, month) for expense in rows)
+            loaded += rows
+        return loaded
+
+    # The months that were in memory (at first, just the current month)
+    def load_expenses(self):
+        with self.lock:
+            months = list(self.resident) or [partition_key(datetime.datetime.now())]
+            self.read_manifest()
+            self.resident.clear()
+            self.months.clear()
+            return self.load_partitions(
+                [month for month in months if month in self.manifest["partitions"]])
+
+    # Partitions for the range that are not in memory yet, and the ids of the
+    # least recently used ones given up to stay within PARTITION_CACHE_SIZE.
+    # Loading everything (no bounds) evicts nothing.
+    def ensure_loaded(self, start=None, end=None, include_end=False):
+        if end is not None and not include_end:
+            end -= datetime.timedelta(microseconds=1)
+        wanted = {month for month in self.manifest["partitions"]
+                  if (start is None or month >= partition_key(start))
+                  and (end is None or month <= partition_key(end))}
+        for month in wanted & self.resident.keys():
+            self.resident.move_to_end(month)
+        loaded = self.load_partitions(sorted(wanted - self.resident.keys()))
+
+        evicted = []
+        if start is not None or end is not None:
+            for month in list(self.resident):
+                if len(self.resident) <= PARTITION_CACHE_SIZE:
+                    break
+                if month not in wanted:
+                    evicted += self.resident.pop(month)
+            for expense_id in evicted:
+                del self.months[expense_id]
+        return loaded, evicted
+
+    def highest_id(self):
+        return self.manifest["next_id"] - 1
+
+    # From the manifest, without reading any partition
+    def is_empty(self):
+        return not any(summary["count"]
+                       for summary in self.manifest["partitions"].values())
+
+    # Rewrite the partitions a change touches, from their current files
+    def update_partitions(self, added=(), removed=()):
+        with self.lock:
+            changes = defaultdict(lambda: ([], set()))
+            for expense_id in removed:
+                month = self.months.pop(expense_id)
+                changes[month][1].add(expense_id)
+                self.resident.get(month, set()).discard(expense_id)
+            for expense in added:
+                month = self.months[expense.id] = partition_key(expense.timestamp)
+                changes[month][0].append(expense)
+                # Months not in memory are read whole when first needed
+                if month in self.resident:
+                    self.resident[month].add(expense.id)
+            for month, (new_rows, removed_ids) in changes.items():
+                rows = [expense for expense in self.read_partition(month)
+                        if expense.id not in removed_ids]
+                self.write_partition(month, rows + new_rows)
+            self.manifest["next_id"] = max(
+                [self.manifest["next_id"]] + [expense.id + 1 for expense in added])
+            self.write_manifest()
+
+    def add_expenses(self, new_expenses):
+        self.update_partitions(added=new_expenses)
+
+    def update_expense(self, expense):
+        self.update_partitions(added=[expense], removed=[expense.id])
+
+    def delete_expenses(self, removed):
+        self.update_partitions(removed=[expense.id for expense in removed])
+
+    # Replace every partition with the given expenses
+    def save_expenses(self, all_expenses):
+        by_month = defaultdict(list)
+        for expense in all_expenses:
+            by_month[partition_key(expense.timestamp)].append(expense)
+        with self.lock:
+            # A fresh instance (convert) has not read the directory yet: take
+            # the manifest's next id and remove every month file not rewritten
+            self.read_manifest()
+            on_disk = {name[:-len(".json")] for name in os.listdir(PARTITIONS_DIR)
+                       if name.endswith(".json") and name != PARTITION_MANIFEST}
+            for month in (set(self.manifest["partitions"]) | on_disk) - by_month.keys():
+                self.write_partition(month, [])
+            for month, rows in by_month.items():
+                self.write_partition(month, rows)
+            self.manifest["next_id"] = max(
+                [self.manifest["next_id"]] + [expense.id + 1 for expense in all_expenses])
+            self.write_manifest()
+
+    def rewrite_snapshot(self, records):
+        self.save_expenses(records)
+
+    def monthly_total(self, category, year, month):
+        summary = self.manifest["partitions"].get(f"{year:04d}-{month:02d}")
+        if summary is None:
+            return 0
+        key = category.lower()
+        return sum(total for name, total in summary["categories"].items()
+                   if name.lower() == key)
+
+    def expenses_between(self, start=None, end=None, include_end=False):
+        ensure_loaded(start, end, include_end)
+        return expenses_between(start, end, include_end)
+
+    def iter_expenses(self, start=None, end=None, include_end=False):
+        ensure_loaded(start, end, include_end)
+        return super().iter_expenses(start, end, include_end)
+
+    def category_totals(self):
+        totals = defaultdict(float)
+        for summary in self.manifest["partitions"].values():
+            for name, total in summary["categories"].items():
+                totals[name] += total
+        return dict(totals)
+
+    def category_names(self):
+        names = set(category_counts)
+        for summary in self.manifest["partitions"].values():
+            names.update(summary["categories"])
+        return names
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    category TEXT NOT NULL,
+    category_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS expenses_by_date ON expenses (timestamp);
+CREATE INDEX IF NOT EXISTS expenses_by_category ON expenses (category_key, timestamp);
+-- No declared type, so integer budgets stay integers as they do in JSON
+CREATE TABLE IF NOT EXISTS budgets (
+    category TEXT PRIMARY KEY,
+    amount
+);
+CREATE TABLE IF NOT EXISTS deleted_expenses (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    amount REAL NOT NULL,
+    category TEXT NOT NULL,
+    batch INTEGER NOT NULL DEFAULT 0,
+    deleted_at TEXT NOT NULL DEFAULT ''
+);
+"""
+
+# Created after upgrade_schema() so older databases have the columns first
+SQLITE_DELETED_INDEXES = """
+CREATE INDEX IF NOT EXISTS deleted_by_batch ON deleted_expenses (batch);
+CREATE INDEX IF NOT EXISTS deleted_by_time ON deleted_expenses (deleted_at);
+"""
+
+
+# SQLite backend: row-level transactional writes and queries pushed down to SQL
+class SqliteStorage:
+    def __init__(self, path=SQLITE_FILE):
+        is_new = not os.path.exists(path)
+        # Autocommit mode; writes go through transaction() explicitly
+        self.conn = sqlite3.connect(path, isolation_level=None,
+                                    timeout=SQLITE_BUSY_TIMEOUT)
+        # Changes whenever another connection commits
+        self.data_version = None
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.upgrade_schema()
+        self.conn.executescript(SQLITE_DELETED_INDEXES)
+        if is_new:
+            self.migrate_from_json()
+
+    # Nested transactions join the one already open
+    @contextlib.contextmanager
+    def transaction(self):
+        if self.conn.in_transaction:
+            yield self.conn
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    # Open a write transaction only if no other connection holds one; the
+    # transactions of locked() sections inside join it
+    def try_lock(self):
+        self.conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            return False
+        finally:
+            self.conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT * 1000}")
+        return True
+
+    def release_lock(self, commit=True):
+        self.conn.execute("COMMIT" if commit else "ROLLBACK")
+
+    # Databases created before deletions were batched lack the batch columns;
+    # their existing rows count as deleted now for retention purposes
+    def upgrade_schema(self):
+        columns = {row[1] for row in
+                   self.conn.execute("PRAGMA table_info(deleted_expenses)")}
+        if "batch" in columns:
+            return
+        with self.transaction() as conn:
+            conn.execute("ALTER TABLE deleted_expenses "
+                         "ADD COLUMN batch INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE deleted_expenses "
+                         "ADD COLUMN deleted_at TEXT NOT NULL DEFAULT ''")
+            conn.execute("UPDATE deleted_expenses SET deleted_at = ?",
+                         (datetime.datetime.now().strftime(DATE_FORMAT),))
+
+    # One-shot import of the JSON files into a freshly created database
+    def migrate_from_json(self):
+        if not os.path.exists(EXPENSES_FILE):
+            return
+        source = JsonStorage()
+        migrated = source.load_expenses()
+        self.save_expenses(migrated)
+        if os.path.exists(BUDGETS_FILE):
+            self.save_budgets(source.load_budgets())
+        with self.transaction() as conn:
+            self.insert_deleted(conn, source.load_deleted())
+        print(f"Migrated {len(migrated)} expenses from {EXPENSES_FILE} "
+              f"into {SQLITE_FILE}")
+
+    @staticmethod
+    def expense_from_row(row):
+        expense_id, date, timestamp, amount, category = row
+        return Expense(amount, category, date,
+                       timestamp=EPOCH + datetime.timedelta(seconds=timestamp),
+                       id=expense_id)
+
+    @staticmethod
+    def expense_to_row(expense):
+        return (expense.id, expense.date, to_epoch(expense.timestamp),
+                expense.amount, expense.category, expense.category.lower())
+
+    # Hold the write lock with other processes' changes merged into memory
+    @contextlib.contextmanager
+    def locked(self):
+        with self.transaction():
+            if self.current_data_version() != self.data_version:
+                merge_external_changes(RELOAD_LEDGER)
+            yield
+
+    def stale(self):
+        return self.current_data_version() != self.data_version
+
+    def current_data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load_expenses(self):
+        self.data_version = self.current_data_version()
+        rows = self.conn.execute(
+            "SELECT id, date, timestamp, amount, category FROM expenses ORDER BY id")
+        return [self.expense_from_row(row) for row in rows]
+
+    # Rows get explicit ids so a batch is a single executemany
+    def insert_expenses(self, conn, new_expenses):
+        next_id = conn.execute(
+            "SELECT COALESCE(MAX(id), 0) + 1 FROM expenses").fetchone()[0]
+        for expense in new_expenses:
+            if expense.id is None:
+                expense.id = next_id
+                next_id += 1
+        conn.executemany(
+            "INSERT INTO expenses (id, date, timestamp, amount, category, category_key) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            map(self.expense_to_row, new_expenses))
+
+    def add_expenses(self, new_expenses):
+        with self.transaction() as conn:
+            self.insert_expenses(conn, new_expenses)
+
+    def update_expense(self, expense):
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE expenses SET date = ?, timestamp = ?, amount = ?, "
+                "category = ?, category_key = ? WHERE id = ?",
+                self.expense_to_row(expense)[1:] + (expense.id,))
+
+    def delete_expenses(self, removed):
+        with self.transaction() as conn:
+            conn.executemany("DELETE FROM expenses WHERE id = ?",
+                             [(expense.id,) for expense in removed])
+
+    def save_expenses(self, all_expenses):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM expenses")
+            self.insert_expenses(conn, all_expenses)
+
+    def close(self, compact=True):
+        self.conn.close()
+
+    def loaded_columns(self, count):
+        return None
+
+    def ensure_loaded(self, start=None, end=None, include_end=False):
+        return [], []
+
+    def highest_id(self):
+        return 0
+
+    def is_empty(self):
+        return not expenses
+
+    def monthly_total(self, category, year, month):
+        start, end = map(to_epoch, month_bounds(year, month))
+        return self.conn.execute(
+            "SELECT COALESCE(SUM(amount), 0) FROM expenses "
+            "WHERE category_key = ? AND timestamp >= ? AND timestamp < ?",
+            (category.lower(), start, end)).fetchone()[0]
+
+    def expenses_between(self, start=None, end=None, include_end=False):
+        return list(self.iter_expenses(start, end, include_end))
+
+    # Rows are fetched from the cursor as they are consumed
+    def iter_expenses(self, start=None, end=None, include_end=False):
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(to_epoch(start))
+        if end is not None:
+            conditions.append("timestamp <= ?" if include_end else "timestamp < ?")
+            params.append(to_epoch(end))
+        if conditions:
+            where = f"WHERE {' AND '.join(conditions)} ORDER BY timestamp, id"
+        else:
+            where = "ORDER BY id"
+        rows = self.conn.execute(
+            f"SELECT id, date, timestamp, amount, category FROM expenses {where}",
+            params)
+        for row in rows:
+            yield self.expense_from_row(row)
+
+    def category_totals(self):
+        rows = self.conn.execute(
+            "SELECT category, SUM(amount) FROM expenses "
+            "GROUP BY category ORDER BY MIN(id)")
+        return dict(rows)
+
+    def category_names(self):
+        return category_counts.keys()
+
+    def load_budgets(self):
+        rows = self.conn.execute(
+            "SELECT category, amount FROM budgets ORDER BY rowid").fetchall()
+        return dict(rows) if rows else dict(DEFAULT_BUDGETS)
+
+    def save_budgets(self, budgets):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM budgets")
+            conn.executemany("INSERT INTO budgets (category, amount) VALUES (?, ?)",
+                             budgets.items())
+
+    # Entries are keyed by row id, assigned up front as for expenses
+    def insert_deleted(self, conn, entries):
+        next_id = conn.execute(
+            "SELECT COALESCE(MAX(id), 0) + 1 FROM deleted_expenses").fetchone()[0]
+        for entry in entries:
+            entry["entry"] = next_id
+            next_id += 1
+        conn.executemany(
+            "INSERT INTO deleted_expenses "
+            "(id, date, amount, category, batch, deleted_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(entry["entry"], entry["expense"].date, entry["expense"].amount,
+              entry["expense"].category, entry["batch"], entry["deleted_at"])
+             for entry in entries])
+
+    def load_deleted(self):
+        rows = self.conn.execute(
+            "SELECT id, date, amount, category, batch, deleted_at "
+            "FROM deleted_expenses ORDER BY id")
+        return [{"entry": entry_id, "batch": batch, "deleted_at": deleted_at,
+                 "expense": Expense(amount, category, date)}
+                for entry_id, date, amount, category, batch, deleted_at in rows]
+
+    def log_deleted(self, deleted_items):
+        entries = new_deleted_entries(deleted_items)
+        with self.transaction() as conn:
+            self.insert_deleted(conn, entries)
+        return entries
+
+    def restore_deleted(self, entry_ids):
+        with self.transaction() as conn:
+            conn.executemany("DELETE FROM deleted_expenses WHERE id = ?",
+                             [(entry_id,) for entry_id in entry_ids])
+
+    def compact_deleted(self, cutoff):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM deleted_expenses WHERE deleted_at < ?",
+                         (cutoff,))
+        return self.load_deleted()
+
+
+STORAGE_BACKENDS = {"json": JsonStorage, "binary": BinaryStorage,
+                    "partitioned": PartitionedStorage, "sqlite": SqliteStorage}
+
+
+# Pick the storage backend, e.g. EXPENSE_STORAGE=sqlite
+def open_storage(name=None):
+    name = name or os.environ.get("EXPENSE_STORAGE", "json")
+    try:
+        return STORAGE_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown storage backend: {name}") from None
+
+
+# Open the storage backend and read the budgets on first use rather than on
+# import, which takes the write lock and may migrate files in the working
+# directory
+def open_ledger():
+    global storage
+    if storage is None:
+        storage = open_storage()
+        monthly_budget.update(load_category_budgets())
+    return storage
+
+
+# Read existing expenses from the storage backend, keyed by id in ledger order
+@instrumented(rows=lambda result: len(result))
+def load_expenses():
+    global next_expense_id
+    open_ledger()
+    loaded = {expense.id: expense for expense in storage.load_expenses()}
+    next_expense_id = max(max(loaded, default=0), storage.highest_id()) + 1
+    return loaded
+
+
+# Save the full expense list to the storage backend
+@instrumented(rows=lambda result: len(expenses))
 def save_expenses():
-    with open("expenses.json", mode="w") as file:
-        json.dump(expenses, file, indent=4)
+    ensure_loaded()
+    storage.save_expenses(list(expenses.values()))
+
+
+# Bring the expenses dated from start up to end (exclusive unless
+# include_end; all of them, without bounds) into the ledger when the backend loads lazily, dropping any it evicted.
+# Reading expenses in is not spending, so it raises no budget alerts
+def ensure_loaded(start=None, end=None, include_end=False):
+    with budget_alerts.muted():
+        load_into_ledger(*storage.ensure_loaded(start, end, include_end))
+
+
+def load_into_ledger(loaded, evicted):
+    if evicted:
+        evicted = [expenses[expense_id] for expense_id in evicted
+                   if expense_id in expenses]
+        # Evicted expenses are still in storage, so their categories stay known
+        for expense in evicted:
+            category_registry.pin(expense.category)
+        remove_from_ledger(evicted)
+    # Expenses added to a month before it was read are already here
+    loaded = [expense for expense in loaded if expense.id not in expenses]
+    if loaded:
+        ordered = sorted(itertools.chain(expenses.items(),
+                                         ((e.id, e) for e in loaded)),
+                         key=lambda pair: pair[0])
+        expenses.clear()
+        expenses.update(ordered)
+        index_expenses(loaded)
+
+
+# Give new expenses ids and add them to the ledger and its indexes
+def add_to_ledger(new_expenses):
+    global next_expense_id
+    for expense in new_expenses:
+        expense.set_id(next_expense_id)
+        next_expense_id += 1
+        expenses[expense.id] = expense
+    index_expenses(new_expenses)
+
+
+# Add new expenses to the ledger and to storage as one locked write; if the
+# write fails they are taken out of the ledger again
+@instrumented(rows=lambda result, new_expenses: len(new_expenses))
+def record_expenses(new_expenses):
+    with storage.locked():
+        add_to_ledger(new_expenses)
+        try:
+            storage.add_expenses(new_expenses)
+        except BaseException:
+            remove_from_ledger(new_expenses)
+            raise
+
+
+# Bring writes made by other processes into memory before this one writes:
+# a list of journal records, or RELOAD_LEDGER to read everything again.
+# Their budget alerts were raised by the process that made them
+def merge_external_changes(changes):
+    global expenses
+    with budget_alerts.muted():
+        if changes == RELOAD_LEDGER:
+            expenses = load_expenses()
+            rebuild_indexes()
+        else:
+            apply_external_records(changes)
+
+
+# Merge other processes' changes into memory for a reader that must not
+# block; while another process holds the write lock, keep what is loaded
+def refresh_ledger():
+    if storage.stale() and storage.try_lock():
+        try:
+            with storage.locked():
+                pass
+        finally:
+            storage.release_lock()
+
+
+def apply_external_records(records):
+    global next_expense_id
+    for record in records:
+        if record["op"] == "delete":
+            unindex_expenses([expenses.pop(expense_id) for expense_id in record["ids"]
+                              if expense_id in expenses])
+            continue
+        expense = Expense.from_dict(record["expense"])
+        previous = expenses.get(expense.id)
+        if previous is not None:
+            unindex_expense(previous)
+        expenses[expense.id] = expense
+        index_expense(expense)
+        next_expense_id = max(next_expense_id, expense.id + 1)
+
+
+# Take expenses out of the ledger and its indexes
+def remove_from_ledger(removed):
+    for expense in removed:
+        del expenses[expense.id]
+    unindex_expenses(removed)
+
+
+# Running totals per (year, month, lowercased category), kept in step with expenses
+monthly_totals = defaultdict(float)
+# Number of expenses recorded under each category name
+category_counts = Counter()
+# Copies of each (date, amount, category) in the ledger, used to skip re-imports
+expense_keys = Counter()
+
+
+# Case- and space-insensitive form of a category name
+def normalize_category(name):
+    return " ".join(name.split()).casefold()
+
+
+# Padded character trigrams, so short names and word edges still match
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Known categories (budgeted or used by an expense) with usage counts and a
+# trigram index, for fast approximate matching of typed category names
+class CategoryRegistry:
+    def __init__(self):
+        self.names = {}
+        self.counts = Counter()
+        self.pinned = set()
+        self.trigram_index = defaultdict(set)
+
+    def clear(self):
+        self.names.clear()
+        self.counts.clear()
+        self.pinned.clear()
+        self.trigram_index.clear()
+
+    def register(self, name):
+        key = normalize_category(name)
+        if key not in self.names:
+            self.names[key] = name
+            for gram in trigrams(key):
+                self.trigram_index[gram].add(key)
+        return key
+
+    def forget(self, key):
+        del self.names[key]
+        for gram in trigrams(key):
+            self.trigram_index[gram].discard(key)
+            if not self.trigram_index[gram]:
+                del self.trigram_index[gram]
+
+    # Budgeted categories stay known even while no expense uses them
+    def pin(self, name):
+        self.pinned.add(self.register(name))
+
+    # Record one more (sign=1) or one fewer (sign=-1) expense in a category
+    def count(self, name, sign):
+        key = self.register(name)
+        self.counts[key] += sign
+        if self.counts[key] <= 0:
+            del self.counts[key]
+            if key not in self.pinned:
+                self.forget(key)
+
+    def lookup(self, name):
+        return self.names.get(normalize_category(name))
+
+    # Closest known category, preferring the most used among equally close ones
+    def suggest(self, name, cutoff=0.7):
+        key = normalize_category(name)
+        overlaps = Counter()
+        for gram in trigrams(key):
+            overlaps.update(self.trigram_index.get(gram, ()))
+
+        best, best_score = None, None
+        for candidate, _ in overlaps.most_common(SUGGESTION_CANDIDATES):
+            ratio = difflib.SequenceMatcher(None, key, candidate).ratio()
+            score = (ratio, self.counts[candidate])
+            if ratio >= cutoff and (best_score is None or score > best_score):
+                best, best_score = candidate, score
+        return self.names[best] if best else None
+
+
+category_registry = CategoryRegistry()
+
+
+# Daily totals and tooltip text per (year, month) for the calendar view,
+# dropped whenever an expense in that month changes
+calendar_cache = {}
+# Bumped by every change to the ledger
+ledger_changes = 0
+# Id handed to the next new expense; continues from the highest loaded id
+next_expense_id = 1
+# Deleted-expense index, loaded on first use: entry id -> log entry, and
+# batch id -> entry ids in deletion order
+deleted_entries = None
+deleted_batches = defaultdict(list)
+
+# Expenses ordered by timestamp, with their timestamps in a parallel list for bisect
+date_keys = []
+date_records = []
+
+
+# Add (sign=1) or remove (sign=-1) one expense from the running totals
+def update_totals(expense, sign):
+    global ledger_changes
+    ledger_changes += 1
+    exp_date = expense.timestamp
+    key = (exp_date.year, exp_date.month, expense.category.lower())
+    monthly_totals[key] += sign * expense.amount
+    if budget_alerts.active:
+        budget_alerts.changes[key] += sign * expense.amount
+    category_counts[expense.category] += sign
+    if category_counts[expense.category] <= 0:
+        del category_counts[expense.category]
+    expense_keys[expense_key(expense)] += sign
+    category_registry.count(expense.category, sign)
+    calendar_cache.pop((exp_date.year, exp_date.month), None)
+
+
+def expense_key(expense):
+    return (expense.date, expense.amount, expense.category)
+
+
+# Add one expense to the aggregate indexes
+def index_expense(expense):
+    update_totals(expense, 1)
+    pos = bisect.bisect_right(date_keys, expense.timestamp)
+    date_keys.insert(pos, expense.timestamp)
+    date_records.insert(pos, expense)
+    if expense_columns is not None:
+        expense_columns.append(expense)
+
+
+# Add a batch of expenses to the aggregate indexes. Large batches are merged
+# into the date index with one sort rather than one list insert per expense.
+def index_expenses(batch):
+    if len(batch) < 64:
+        for expense in batch:
+            index_expense(expense)
+        return
+
+    for expense in batch:
+        update_totals(expense, 1)
+    date_records.extend(batch)
+    date_records.sort(key=lambda e: e.timestamp)
+    date_keys[:] = [e.timestamp for e in date_records]
+    if expense_columns is not None:
+        for expense in batch:
+            expense_columns.append(expense)
+
+
+# Remove one expense from the aggregate indexes
+def unindex_expense(expense):
+    update_totals(expense, -1)
+    lo = bisect.bisect_left(date_keys, expense.timestamp)
+    hi = bisect.bisect_right(date_keys, expense.timestamp)
+    for pos in range(lo, hi):
+        if date_records[pos] is expense:
+            del date_keys[pos]
+            del date_records[pos]
+            break
+    invalidate_expense_columns()
+
+
+# Remove a batch of expenses from the aggregate indexes. Large batches are
+# filtered out of the date index in one pass rather than deleted one by one.
+def unindex_expenses(batch):
+    if len(batch) < 64:
+        for expense in batch:
+            unindex_expense(expense)
+        return
+
+    for expense in batch:
+        update_totals(expense, -1)
+    removed = {expense.id for expense in batch}
+    date_records[:] = [e for e in date_records if e.id not in removed]
+    date_keys[:] = [e.timestamp for e in date_records]
+    invalidate_expense_columns()
+
+
+# Build the aggregate indexes from scratch, once per load
+@instrumented(rows=lambda result: len(expenses))
+def rebuild_indexes():
+    with budget_alerts.muted():
+        index_ledger()
+
+
+def index_ledger():
+    global expense_columns
+    monthly_totals.clear()
+    category_counts.clear()
+    expense_keys.clear()
+    calendar_cache.clear()
+    category_registry.clear()
+    for category in monthly_budget:
+        category_registry.pin(category)
+    # Categories of expenses a lazy backend has not read in yet
+    for category in storage.category_names():
+        category_registry.pin(category)
+    # The binary backend supplies the columns of the ledger it just read
+    expense_columns = storage.loaded_columns(len(expenses))
+    for expense in expenses.values():
+        update_totals(expense, 1)
+    date_records[:] = sorted(expenses.values(), key=lambda e: e.timestamp)
+    date_keys[:] = [e.timestamp for e in date_records]
+
+
+# Expenses dated from start up to end (exclusive unless include_end), oldest first
+def expenses_between(start=None, end=None, include_end=False):
+    lo, hi = date_bounds(start, end, include_end)
+    return date_records[lo:hi]
+
+
+# Positions in the date index that bound a date range
+def date_bounds(start=None, end=None, include_end=False):
+    lo = 0 if start is None else bisect.bisect_left(date_keys, start)
+    if end is None:
+        hi = len(date_keys)
+    elif include_end:
+        hi = bisect.bisect_right(date_keys, end)
+    else:
+        hi = bisect.bisect_left(date_keys, end)
+    return lo, hi
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+SECONDS_PER_DAY = 86400
+
+
+# Seconds since the epoch for a naive timestamp, treating it as UTC
+def to_epoch(timestamp):
+    return (timestamp - EPOCH) // datetime.timedelta(seconds=1)
+
+
+# First moment of a month and of the month after it
+def month_bounds(year, month):
+    return (datetime.datetime(year, month, 1),
+            datetime.datetime(year + month // 12, month % 12 + 1, 1))
+
+
+# Column-oriented copy of the ledger used by the analytics views
+class ExpenseColumns:
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.amounts = np.empty(capacity, dtype=np.float64)
+        self.category_codes = np.empty(capacity, dtype=np.int32)
+        self.categories = []
+        self.category_lookup = {}
+
+    @classmethod
+    @instrumented(rows=lambda result, cls, records: len(records))
+    def from_expenses(cls, records):
+        columns = cls(max(len(records), 1024))
+        count = len(records)
+        columns.timestamps[:count] = np.fromiter(
+            (to_epoch(e.timestamp) for e in records), np.int64, count)
+        columns.amounts[:count] = np.fromiter(
+            (e.amount for e in records), np.float64, count)
+        columns.category_codes[:count] = np.fromiter(
+            (columns.intern(e.category) for e in records), np.int32, count)
+        columns.size = count
+        return columns
+
+    # Wrap existing arrays as they are, e.g. the columns copied out of a
+    # binary ledger; the first append moves them into growable arrays
+    @classmethod
+    def from_arrays(cls, timestamps, amounts, category_codes, categories):
+        columns = cls(0)
+        columns.timestamps, columns.amounts = timestamps, amounts
+        columns.category_codes = category_codes
+        columns.categories = list(categories)
+        columns.category_lookup = {name: code for code, name in enumerate(categories)}
+        columns.size = len(timestamps)
+        return columns
+
+    def intern(self, category):
+        code = self.category_lookup.get(category)
+        if code is None:
+            code = self.category_lookup[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def append(self, expense):
+        if self.size == len(self.timestamps):
+            capacity = max(2 * self.size, 1024)
+            self.timestamps = np.resize(self.timestamps, capacity)
+            self.amounts = np.resize(self.amounts, capacity)
+            self.category_codes = np.resize(self.category_codes, capacity)
+        self.timestamps[self.size] = to_epoch(expense.timestamp)
+        self.amounts[self.size] = expense.amount
+        self.category_codes[self.size] = self.intern(expense.category)
+        self.size += 1
+
+    # Views over the filled part of each column
+    def columns(self):
+        return (self.timestamps[:self.size], self.amounts[:self.size],
+                self.category_codes[:self.size])
+
+    @instrumented(rows=lambda result, self: self.size)
+    def category_totals(self):
+        _, amounts, codes = self.columns()
+        counts = np.bincount(codes, minlength=len(self.categories))
+        sums = np.bincount(codes, weights=amounts,
+                           minlength=len(self.categories))
+        return {self.categories[code]: float(sums[code])
+                for code in np.flatnonzero(counts)}
+
+    # Totals per day, ISO week or month, sorted by period
+    @instrumented(rows=lambda result, self, granularity: self.size)
+    def period_totals(self, granularity):
+        timestamps, amounts, _ = self.columns()
+        days = timestamps // SECONDS_PER_DAY
+        if granularity == "daily":
+            keys, sums = group_sum(days, amounts)
+            labels = np.datetime_as_string(keys.astype("datetime64[D]"))
+        elif granularity == "weekly":
+            # ISO weeks belong to the year their Thursday falls in
+            thursdays = days - (days + 3) % 7 + 3
+            iso_years = thursdays.astype("datetime64[D]").astype(
+                "datetime64[Y]")
+            weeks = (thursdays - iso_years.astype("datetime64[D]").astype(
+                np.int64)) // 7 + 1
+            keys, sums = group_sum(
+                (iso_years.astype(np.int64) + 1970) * 100 + weeks, amounts)
+            labels = [f"{key // 100}-W{key % 100}" for key in keys.tolist()]
+        elif granularity == "monthly":
+            months = days.astype("datetime64[D]").astype("datetime64[M]")
+            keys, sums = group_sum(months.astype(np.int64), amounts)
+            labels = np.datetime_as_string(keys.astype("datetime64[M]"))
+        else:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        return list(labels), sums.tolist()
+
+
+# Sum values per distinct key, returning the sorted keys and their sums
+def group_sum(keys, values):
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(inverse, weights=values,
+                                    minlength=len(unique_keys))
+
+
+# Built lazily for analytics; appends keep it current, edits and deletes reset it
+expense_columns = None
+
+
+def get_expense_columns():
+    global expense_columns
+    ensure_loaded()
+    if expense_columns is None:
+        expense_columns = ExpenseColumns.from_expenses(expenses.values())
+    return expense_columns
+
+
+def invalidate_expense_columns():
+    global expense_columns
+    expense_columns = None
 
 
 # Reading the categories of expenses
 def load_category_budgets():
-    try:
-        with open("category_budgets.json", mode="r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {
-            "Transportation": 10000,
-            "Groceries": 30000,
-            "Entertainment": 5000
-        }
+    return storage.load_budgets()
 
 
-# Saving category budgets
+# Saving category budgets, keeping any categories other processes added meanwhile
 def save_category_budgets():
-    with open("category_budgets.json", mode="w") as file:
-        json.dump(monthly_budget, file, indent=4)
+    with storage.locked():
+        saved = storage.load_budgets()
+        saved.update(monthly_budget)
+        monthly_budget.update(saved)
+        storage.save_budgets(saved)
 
 
 # Add expenses
@@ -52,56 +1962,271 @@ def add_expense(amount, category):
         print("Expense not added.")
         return
 
-    current_time = datetime.datetime.now()
-    expense = {
-        "amount": amount,
-        "category": category,
-        "date": current_time.strftime("%Y-%m-%d %H:%M:%S")
-    }
-    expenses.append(expense)
-    save_expenses()
+    expense = new_expense(amount, category)
+    record_expenses([expense])
     print(
-        f"Added expense: {amount} in category: {category} on {expense['date']}")
-
-    # Check against monthly budget
-    budget = monthly_budget.get(category)
-    if budget:
-        spent = get_monthly_total(category)
-        if spent > budget:
-            print(
-                f"⚠️ Warning: You have exceeded your monthyl budget for {category}!")
-        elif spent > 0.9 * budget:
-            print(
-                f"🔔 Heads up! You're close to reaching your monthly budget for {category}")
+        f"Added expense: {amount} in category: {category} on {expense.date}")
+    budget_alerts.flush()
+
+
+# Build an expense dated now unless a date is given, raising ValueError when unusable
+def new_expense(amount, category, date=None):
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid amount: {amount!r}") from None
+    if not math.isfinite(amount):
+        raise ValueError(f"invalid amount: {amount!r}")
+    if amount < 0:
+        raise ValueError("negative amount")
+    if date is not None and not isinstance(date, str):
+        raise ValueError(f"invalid date: {date!r}")
+    if date:
+        return Expense(amount, category, date)
+    current_time = datetime.datetime.now().replace(microsecond=0)
+    return Expense(amount, category, current_time.strftime(DATE_FORMAT),
+                   timestamp=current_time)
+
+
+# Alert levels from text such as "0.9,1", sorted; raises ValueError when unusable
+def alert_levels(text):
+    try:
+        levels = sorted({float(level) for level in text.split(",") if level.strip()})
+    except ValueError:
+        raise ValueError(f"invalid alert levels: {text!r}") from None
+    if not levels or levels[0] <= 0 or not all(map(math.isfinite, levels)):
+        raise ValueError(f"invalid alert levels: {text!r}")
+    return tuple(levels)
+
+
+# Raises an event whenever a category's spending in a month crosses one of the
+# levels of its budget, up or down. update_totals records how much each
+# change moved a (year, month, category) total, and flush compares the totals
+# before and after those changes once per action, so a bulk import raises one
+# alert per crossing rather than one per expense. Events are dicts passed to
+# each of the sinks in turn
+class BudgetAlerts:
+    def __init__(self, levels=BUDGET_ALERT_LEVELS, sinks=()):
+        self.levels = tuple(levels)
+        self.sinks = list(sinks)
+        self.changes = defaultdict(float)
+        self.mute_depth = 0
+        self.active = True
+
+    # Changes inside, such as loading or merging other processes' writes,
+    # are left out of the alerts
+    @contextlib.contextmanager
+    def muted(self):
+        self.mute_depth += 1
+        self.active = False
+        try:
+            yield
+        finally:
+            self.mute_depth -= 1
+            self.active = not self.mute_depth
+
+    # Collect the events flushed inside into a list as well
+    @contextlib.contextmanager
+    def collecting(self):
+        events = []
+        self.sinks.append(events.append)
+        try:
+            yield events
+        finally:
+            self.sinks.remove(events.append)
+
+    # Number of levels strictly exceeded
+    def crossed(self, spent, budget):
+        return bisect.bisect_left(self.levels, spent / budget)
+
+    def flush(self):
+        changes, self.changes = self.changes, defaultdict(float)
+        budgets = {category.lower(): (category, budget)
+                   for category, budget in monthly_budget.items() if budget}
+        events = []
+        for (year, month, key), change in changes.items():
+            if key not in budgets:
+                continue
+            category, budget = budgets[key]
+            spent = storage.monthly_total(category, year, month)
+            before, after = (self.crossed(spent - change, budget),
+                             self.crossed(spent, budget))
+            if before == after:
+                continue
+            events.append({
+                "category": category, "year": year, "month": month,
+                "level": self.levels[after - 1] if after else None,
+                "previous": self.levels[before - 1] if before else None,
+                "spent": spent, "budget": budget, "rising": after > before})
+        for event in events:
+            for sink in self.sinks:
+                sink(event)
+        return events
+
+
+# Message for a rising event, naming the month unless it is the current one
+def budget_alert_message(event):
+    category, level = event["category"], event["level"]
+    now = datetime.datetime.now()
+    if (event["year"], event["month"]) != (now.year, now.month):
+        category += f" in {calendar.month_name[event['month']]} {event['year']}"
+    if level == 1:
+        return f"⚠️ Warning: You have exceeded your monthyl budget for {category}!"
+    if level > 1:
+        return (f"⚠️ Warning: You have spent over {level:.0%} of your monthly "
+                f"budget for {category}!")
+    if level == 0.9:
+        return f"🔔 Heads up! You're close to reaching your monthly budget for {category}"
+    return f"🔔 Heads up! You've used over {level:.0%} of your monthly budget for {category}"
+
+
+# Console sink: spending coming back under a level is not worth a message
+def print_budget_alert(event):
+    if event["rising"]:
+        print(budget_alert_message(event))
+
+
+# Sink appending every event to a JSON-lines file
+def alert_log_sink(path):
+    def write_event(event):
+        with open(path, mode="a", encoding="utf-8") as file:
+            file.write(json.dumps(event, ensure_ascii=False) + "\n")
+    return write_event
+
+
+# Levels from EXPENSE_ALERT_LEVELS; an unusable value is reported and the
+# default levels apply rather than the import failing
+def env_alert_levels():
+    levels = os.environ.get(ALERT_LEVELS_ENV)
+    if not levels:
+        return BUDGET_ALERT_LEVELS
+    try:
+        return alert_levels(levels)
+    except ValueError as error:
+        print(f"Warning: ignoring {ALERT_LEVELS_ENV}: {error}", file=sys.stderr)
+        return BUDGET_ALERT_LEVELS
+
+
+def open_budget_alerts():
+    alerts = BudgetAlerts(env_alert_levels(), [print_budget_alert])
+    log_path = os.environ.get(ALERT_LOG_ENV)
+    if log_path:
+        alerts.sinks.append(alert_log_sink(log_path))
+    return alerts
+
+
+PAGER_HELP = "n/p: next/previous page, d YYYY-MM-DD: jump to date, c CATEGORY: filter"
+
+
+# Paginated view over the ledger that formats only the visible page. Rows are
+# in ledger order until a date jump switches the view to date order, and the
+# numbers shown map to the expenses themselves rather than list positions
+class ExpensePager:
+    def __init__(self, line_format, page_size=PAGE_SIZE):
+        self.line_format = line_format
+        self.page_size = page_size
+        self.page = 0
+        self.category = None
+        self.by_date = False
+        self.filtered = None
+        self.shown = {}
+
+    def rows(self):
+        source = date_records if self.by_date else expenses.values()
+        if self.category is None:
+            return source
+        if self.filtered is None:
+            self.filtered = [expense for expense in source
+                             if normalize_category(expense.category) == self.category]
+        return self.filtered
+
+    # Rebuild the filtered rows after the ledger changes
+    def refresh(self):
+        self.filtered = None
+
+    def page_count(self):
+        return max(1, math.ceil(len(self.rows()) / self.page_size))
+
+    def render(self):
+        rows = self.rows()
+        self.page = min(self.page, self.page_count() - 1)
+        start = self.page * self.page_size
+        self.shown = {}
+        if isinstance(rows, list):
+            page = rows[start:start + self.page_size]
+        else:
+            page = itertools.islice(rows, start, start + self.page_size)
+        for number, expense in enumerate(page, start=start + 1):
+            self.shown[number] = expense
+            print(self.line_format(number, expense))
+        filters = f", category: {self.category}" if self.category else ""
+        if self.by_date:
+            filters += ", by date"
+        print(f"Page {self.page + 1}/{self.page_count()} ({len(rows)} expenses{filters})")
+
+    # The expense shown under a number on the current page, or None
+    def select(self, number):
+        return self.shown.get(number)
+
+    def jump_to_date(self, date):
+        target = datetime.datetime.strptime(date, "%Y-%m-%d")
+        self.by_date = True
+        self.refresh()
+        pos = bisect.bisect_left(self.rows(), target,
+                                 key=lambda expense: expense.timestamp)
+        self.page = pos // self.page_size
+
+    # Apply a paging or filter command; returns False if input is not one
+    def handle(self, command):
+        key, _, arg = command.strip().partition(" ")
+        key = key.lower()
+        if key == "n":
+            self.page = min(self.page + 1, self.page_count() - 1)
+        elif key == "p":
+            self.page = max(self.page - 1, 0)
+        elif key == "d":
+            try:
+                self.jump_to_date(arg.strip())
+            except ValueError:
+                print("Invalid date format. Please use YYYY-MM-DD.")
+        elif key == "c":
+            self.category = normalize_category(arg) or None
+            self.page = 0
+            self.refresh()
+        else:
+            return False
+        return True
 
 
 # Edit expenses
 def edit_expense():
+    ensure_loaded()
     if not expenses:
         print('No expenses to edit.')
         return
 
     choice = ""
+    pager = ExpensePager(
+        lambda number, expense: f'{number}.{expense.category}: ¥{expense.amount} on {expense.date}')
 
     while True:
         print('\n✏️ Your expenses:')
-        for i, expense in enumerate(expenses):
-            print(
-                f'{i+1}.{expense["category"]}: ¥{expense["amount"]} on {expense["date"]}')
+        pager.render()
 
         try:
-            choice = input("Enter the number of expense to edit: ").strip()
+            choice = input(
+                f"Enter the number of expense to edit ({PAGER_HELP}): ").strip()
             if not choice:
                 print("Edit cancelled.")
                 return
+            if pager.handle(choice):
+                continue
 
-            idx = int(choice) - 1
-            if idx < 0 or idx >= len(expenses):
+            expense = pager.select(int(choice))
+            if expense is None:
                 print("Invalid number. Try again.")
                 continue
 
-            expense = expenses[idx]
-
             print('\nWhat would you like to edit?')
             print('1. Amount')
             print('2. Category')
@@ -117,7 +2242,7 @@ def edit_expense():
                         if new_amount < 0:
                             print("Amount cannot be negative.")
                             continue
-                        expense["amount"] = new_amount
+                        changes = {"amount": new_amount}
                         break
                     except ValueError:
                         print("Please enter a valid number.")
@@ -126,7 +2251,7 @@ def edit_expense():
                 new_category = input("Enter new category: ").strip()
                 validated_category = validate_or_suggest_category(new_category)
                 if validated_category:
-                    expense["category"] = validated_category
+                    changes = {"category": validated_category}
                 else:
                     print("Category change cancelled.")
                     return
@@ -137,9 +2262,8 @@ def edit_expense():
                         "Enter new date (YYYY-MM-DD HH:MM:SS): ").strip()
                     try:
                         new_date = datetime.datetime.strptime(
-                            new_date_str, "%Y-%m-%d %H:%M:%S")
-                        expense["date"] = new_date.strftime(
-                            "%Y-%m-%d %H:%M:%S")
+                            new_date_str, DATE_FORMAT)
+                        changes = {"date": new_date.strftime(DATE_FORMAT)}
                         break
                     except ValueError:
                         print("Invalid format. Please use YYYY-MM-DD HH:MM:SS")
@@ -151,7 +2275,16 @@ def edit_expense():
                 print("Invalid choice. Try again.")
                 continue
 
-            save_expenses()
+            with storage.locked():
+                # Another process may have changed or deleted it meanwhile
+                expense = expenses.get(expense.id)
+                if expense is None:
+                    print("That expense has since been deleted. Nothing was changed.")
+                    return
+                unindex_expense(expense)
+                expense.update(changes)
+                index_expense(expense)
+                storage.update_expense(expense)
             print("✅ Expense updated successfully.")
             return
 
@@ -161,118 +2294,268 @@ def edit_expense():
 
 # Delete Expenses
 def delete_expense():
+    ensure_loaded()
     if not expenses:
         print("No expenses to delete.")
         return
 
+    pager = ExpensePager(
+        lambda number, expense: f"{number}. {expense.category}: {expense.amount} on {expense.date}.")
+
     while True:
         print("\nYour expenses:")
-        for i, expense in enumerate(expenses):
-            print(
-                f"{i+1}. {expense['category']}: {expense['amount']} on {expense['date']}.")
+        pager.render()
         input_str = input(
-            "Enter the numbers of the expenses to delete (comma-separated), or press Enter to cancel: ")
+            "Enter the numbers of the expenses to delete (comma-separated), "
+            f"{PAGER_HELP}, or press Enter to cancel: ")
         if not input_str:
             print("No expenses deleted.")
             break
+        if pager.handle(input_str):
+            continue
 
         try:
-            indexes = [int(i.strip()) - 1 for i in input_str.split(",")]
+            selected = [pager.select(int(i.strip())) for i in input_str.split(",")]
 
-            # Checking if indexes are valid
-            if any(idx < 0 or idx >= len(expenses) for idx in indexes):
+            # Checking if the numbers are on the current page
+            if any(expense is None for expense in selected):
                 print(
                     "One or more invalid numbers entered. No expenses were deleted. Please try again.")
                 continue
 
-            # Remove in reverse order to prevent index shift
-            indexes = sorted(set(indexes), reverse=True)
-            deleted_items = []
+            with storage.locked():
+                # The same number entered twice deletes the expense once, and
+                # any another process deleted meanwhile are skipped
+                deleted_items = [expenses[expense_id] for expense_id
+                                 in dict.fromkeys(e.id for e in selected)
+                                 if expense_id in expenses]
+                remove_from_ledger(deleted_items)
 
-            for idx in indexes:
-                deleted_items.append(expenses.pop(idx))
+                log_deleted_expenses(deleted_items)
 
-            log_deleted_expenses(deleted_items)
-
-            save_expenses()
+                storage.delete_expenses(deleted_items)
 
             print(f"Deleted the following expenses:")
             for item in deleted_items:
                 print(
-                    f"{item["category"]} - {item["amount"]} on {item["date"]}")
+                    f"{item.category} - {item.amount} on {item.date}")
             break
 
         except ValueError:
             print('Input invalid. Please enter numbers separated by commas.')
 
 
-# Saving deleted expenses in a file
+# Saving deleted expenses in the append-only deletion log
+@instrumented(rows=lambda result, deleted_items: len(deleted_items))
 def log_deleted_expenses(deleted_items):
+    entries = storage.log_deleted(deleted_items)
+    if deleted_entries is not None:
+        index_deleted(entries)
+
+
+def index_deleted(entries):
+    for entry in entries:
+        deleted_entries[entry["entry"]] = entry
+        deleted_batches[entry["batch"]].append(entry["entry"])
+
+
+# Build the deleted-expense index on first use, compacting the log on the way
+def load_deleted_index(retention_days=DELETED_RETENTION_DAYS):
+    global deleted_entries
+    if deleted_entries is not None:
+        return
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+    deleted_entries = {}
+    deleted_batches.clear()
+    index_deleted(storage.compact_deleted(cutoff.strftime(DATE_FORMAT)))
+
+
+# Put deleted expenses back into the ledger and drop them from the log
+def restore_deleted_expenses(entry_ids):
+    load_deleted_index()
+    restored = []
+    for entry_id in entry_ids:
+        entry = deleted_entries.pop(entry_id)
+        batch = deleted_batches[entry["batch"]]
+        batch.remove(entry_id)
+        if not batch:
+            del deleted_batches[entry["batch"]]
+        # Restored expenses get fresh ids, as the old ones may have been reused
+        restored.append(entry["expense"])
+
+    with storage.locked():
+        record_expenses(restored)
+        storage.restore_deleted(entry_ids)
+    return restored
+
+
+def restore_deleted_expense():
+    load_deleted_index()
+    if not deleted_entries:
+        print("No deleted expenses to restore.")
+        return
+
+    batches = sorted(deleted_batches, reverse=True)[:RESTORE_BATCHES_SHOWN]
+    numbered = []
+    print("\nRecently deleted expenses:")
+    for b, batch in enumerate(batches, start=1):
+        entry_ids = deleted_batches[batch]
+        print(f"Batch B{b} (deleted {deleted_entries[entry_ids[0]]['deleted_at']}):")
+        for entry_id in entry_ids:
+            numbered.append(entry_id)
+            expense = deleted_entries[entry_id]["expense"]
+            print(f"  {len(numbered)}. {expense.category}: {expense.amount} on {expense.date}.")
+
+    input_str = input(
+        "Enter the numbers to restore (comma-separated), B<n> for a whole batch, "
+        "or press Enter to cancel: ").strip()
+    if not input_str:
+        print("No expenses restored.")
+        return
+
     try:
-        with open("deleted_expenses.json", mode="r") as file:
-            deleted_log = json.load(file)
-    except FileNotFoundError:
-        deleted_log = []
+        if input_str.upper().startswith("B"):
+            positions = [int(input_str[1:])]
+            choices = batches
+        else:
+            positions = [int(i.strip()) for i in input_str.split(",")]
+            choices = numbered
+        if any(pos < 1 or pos > len(choices) for pos in positions):
+            raise ValueError
+    except ValueError:
+        print("Invalid selection. No expenses were restored.")
+        return
 
-    deleted_log.extend(deleted_items)
+    if choices is batches:
+        entry_ids = list(deleted_batches[batches[positions[0] - 1]])
+    else:
+        entry_ids = list(dict.fromkeys(numbered[pos - 1] for pos in positions))
 
-    with open("deleted_expenses.json", mode="w") as file:
-        json.dump(deleted_log, file, indent=4)
+    print("Restored the following expenses:")
+    for item in restore_deleted_expenses(entry_ids):
+        print(f"{item.category} - {item.amount} on {item.date}")
 
 
 # Helper function to calculate total spent this month in a category
+@instrumented()
 def get_monthly_total(category):
     now = datetime.datetime.now()
-    total = 0
-    for expense in expenses:
-        exp_date = datetime.datetime.strptime(
-            expense["date"], "%Y-%m-%d %H:%M:%S")
-        if (expense["category"].lower() == category.lower() and exp_date.year == now.year and exp_date.month == now.month):
-            total += expense["amount"]
-    return total
+    return storage.monthly_total(category, now.year, now.month)
 
 
 # Display expenses
 def show_expenses():
-    if expenses:
-        print("\nYour Expenses:")
-        for expense in expenses:
-            print(
-                f'{expense["category"]}: {expense["amount"]} on {expense['date']}')
-    else:
+    ensure_loaded()
+    if not expenses:
         print("No expenses to show.")
+        return
+
+    pager = ExpensePager(
+        lambda number, expense: f'{expense.category}: {expense.amount} on {expense.date}')
+    print("\nYour Expenses:")
+    while True:
+        pager.render()
+        if len(expenses) <= pager.page_size:
+            return
+        command = input(f"{PAGER_HELP}, or press Enter to return: ")
+        if not command.strip():
+            return
+        if not pager.handle(command):
+            print("Unknown command.")
 
 
 # Display monthly summary
 def show_monthly_summary():
-    print("\n📊 Monthly Budget Summary: ")
-    print("*"*50)
+    print_monthly_summary(monthly_summary())
+
+
+BUDGET_STATUSES = {
+    "no_budget": "❓ No budget set",
+    "over": "‼️ Over budget",
+    "near": "⚠️ Near limit",
+    "under": "✅ Under budget",
+}
+
+
+# Budget, spending and status per category for one month (default: this month)
+@instrumented()
+def monthly_summary(year=None, month=None):
     now = datetime.datetime.now()
-    categories = set([expense["category"]
-                     for expense in expenses] + list(monthly_budget.keys()))
+    year, month = year or now.year, month or now.month
+    categories = set(storage.category_names()) | set(monthly_budget.keys())
 
+    summary = []
     for category in sorted(categories):
-        spent = get_monthly_total(category)
+        spent = storage.monthly_total(category, year, month)
         budget = monthly_budget.get(category, 0)
-        remaining = budget - spent
 
         if budget == 0:
-            status = "❓ No budget set"
+            status = "no_budget"
         elif spent > budget:
-            status = "‼️ Over budget"
+            status = "over"
         elif spent > 0.9 * budget:
-            status = "⚠️ Near limit"
+            status = "near"
         else:
-            status = "✅ Under budget"
+            status = "under"
+
+        summary.append({"category": category, "budget": budget, "spent": spent,
+                        "remaining": budget - spent, "status": status})
+    return summary
+
 
-        print(f"Category  :  {category}")
-        print(f"Budget    :  ¥{budget}")
-        print(f"Spent     :  ¥{spent}")
-        print(f"Remaining :  ¥{remaining}")
-        print(f"Status    :  {status}")
+def print_monthly_summary(summary):
+    print("\n📊 Monthly Budget Summary: ")
+    print("*"*50)
+    for row in summary:
+        print(f"Category  :  {row['category']}")
+        print(f"Budget    :  ¥{row['budget']}")
+        print(f"Spent     :  ¥{row['spent']}")
+        print(f"Remaining :  ¥{row['remaining']}")
+        print(f"Status    :  {BUDGET_STATUSES[row['status']]}")
         print("*"*50)
 
 
+# Date filters behind the filter menu, usable without any prompts.
+# period is "week", "month" or "range"; a range includes its end date.
+@instrumented(rows=lambda result, *args: len(result[1]))
+def query_expenses_by_date(period, start_date=None, end_date=None, now=None):
+    now = now or datetime.datetime.now()
+
+    if period == "week":
+        # Start of week: last Sunday at 00:00:00
+        start_of_week = datetime.datetime.combine(
+            (now - datetime.timedelta(days=now.weekday() + 1)).date(),
+            datetime.time.min
+        )
+
+        # End of week: next Saturday at 23:59:59
+        days_to_saturday = 5 - now.weekday() if now.weekday() <= 5 else 6
+        end_of_week = datetime.datetime.combine(
+            (now + datetime.timedelta(days=days_to_saturday)).date(),
+            datetime.time.max
+        )
+
+        label = f"This Week ({start_of_week.date()} to {end_of_week.date()})"
+        return label, storage.expenses_between(start_of_week, end_of_week,
+                                               include_end=True)
+
+    if period == "month":
+        start_of_month = now.replace(day=1)
+        return "This Month", storage.expenses_between(start_of_month)
+
+    if period == "range":
+        if end_date < start_date:
+            raise ValueError("End date cannot be earlier than start date.")
+        start = datetime.datetime.combine(start_date, datetime.time.min)
+        # end date also included
+        end = datetime.datetime.combine(
+            end_date, datetime.time.min) + datetime.timedelta(days=1)
+        label = f"From {start.date()} to {(end - datetime.timedelta(days=1)).date()}"
+        return label, storage.expenses_between(start, end)
+
+    raise ValueError(f"Unknown period: {period}")
+
+
 # Filter while viewing
 def filter_expenses_by_date():
     while True:
@@ -284,36 +2567,12 @@ def filter_expenses_by_date():
 
         choice = input("Choose an option: ").strip()
 
-        now = datetime.datetime.now()
-        filtered = []
-        lable = ""
-
         if choice == "1":
-            # Start of week: last Sunday at 00:00:00
-            start_of_week = datetime.datetime.combine(
-                (now - datetime.timedelta(days=now.weekday() + 1)).date(),
-                datetime.time.min
-            )
-
-            # End of week: next Saturday at 23:59:59
-            days_to_saturday = 5 - now.weekday() if now.weekday() <= 5 else 6
-            end_of_week = datetime.datetime.combine(
-                (now + datetime.timedelta(days=days_to_saturday)).date(),
-                datetime.time.max
-            )
-
-            filtered = [
-                e for e in expenses
-                if start_of_week <= datetime.datetime.strptime(e["date"], "%Y-%m-%d %H:%M:%S") <= end_of_week
-            ]
-            label = f"This Week ({start_of_week.date()} to {end_of_week.date()})"
+            label, filtered = query_expenses_by_date("week")
             break
 
         elif choice == "2":
-            start_of_month = now.replace(day=1)
-            filtered = [e for e in expenses if datetime.datetime.strptime(
-                e["date"], "%Y-%m-%d %H:%M:%S") >= start_of_month]
-            label = "This Month"
+            label, filtered = query_expenses_by_date("month")
             break
 
         elif choice == "3":
@@ -325,24 +2584,19 @@ def filter_expenses_by_date():
 
                     start_date = datetime.datetime.strptime(
                         start_str, "%Y-%m-%d")
-                    end_date = datetime.datetime.strptime(
-                        end_str, "%Y-%m-%d") + datetime.timedelta(days=1)
-                    # end date also included
-
-                    if end_date < start_date:
-                        print(
-                            "❗️End date cannot be earlier than start date. Please try again.")
-                        continue
-
-                    filtered = [
-                        e for e in expenses
-                        if start_date <= datetime.datetime.strptime(e["date"], "%Y-%m-%d %H:%M:%S") < end_date
-                    ]
-                    label = f"From {start_date.date()} to {(end_date - datetime.timedelta(days=1)).date()}"
-                    break
+                    end_date = datetime.datetime.strptime(end_str, "%Y-%m-%d")
                 except ValueError:
                     print('Invalid date format. Please use YYYY-MM-DD format.')
                     continue
+
+                if end_date < start_date:
+                    print(
+                        "❗️End date cannot be earlier than start date. Please try again.")
+                    continue
+
+                label, filtered = query_expenses_by_date(
+                    "range", start_date, end_date)
+                break
             break
 
         elif choice == "0":
@@ -351,28 +2605,35 @@ def filter_expenses_by_date():
             print('Invalid choice. Please enter again.')
             continue
 
+    print_filtered_expenses(label, filtered)
+
+
+def print_filtered_expenses(label, filtered):
     print(f"\n📂 Expenses - {label}")
     if not filtered:
         print('No expenses found in this range.')
     else:
         for e in filtered:
-            print(f'{e["category"]}: ¥{e["amount"]} on {e["date"]}')
+            print(f'{e.category}: ¥{e.amount} on {e.date}')
 
 
 # Category wise breakdown (viewing)
+@instrumented()
 def show_category_breakdown():
-    if not expenses:
+    totals = storage.category_totals()
+    if not totals:
         print("No expenses to analyze.")
         return
 
-    totals = defaultdict(float)
-    for exp in expenses:
-        totals[exp["category"]] += exp["amount"]
+    draw_category_breakdown(totals)
+    plt.show()
 
+
+def draw_category_breakdown(totals):
     categories = list(totals.keys())
     amounts = list(totals.values())
 
-    plt.figure(figsize=(10, 6))
+    fig = plt.figure(figsize=(10, 6))
     plt.bar(categories, amounts, color='skyblue')
     plt.title("💸 Total Spent per Category")
     plt.xlabel("Category")
@@ -380,11 +2641,13 @@ def show_category_breakdown():
     plt.xticks(rotation=45)
     plt.tight_layout()
     plt.grid(axis='y', linestyle='--', alpha=0.7)
-    plt.show()
+    return fig
 
 
 # Time based trend (viewing)
+@instrumented()
 def show_time_based_trend():
+    ensure_loaded()
     if not expenses:
         print("No expenses to analyze.")
         return
@@ -395,34 +2658,25 @@ def show_time_based_trend():
     print("3. Monthly")
     granularity = input("Enter your choice: ").strip()
 
-    totals = defaultdict(float)
-
-    for exp in expenses:
-        date = datetime.datetime.strptime(exp["date"], "%Y-%m-%d %H:%M:%S")
-
-        if granularity == "1":
-            key = date.strftime("%Y-%m-%d")
-        elif granularity == "2":
-            # Year-Week
-            key = f"{date.isocalendar()[0]}-W{date.isocalendar()[1]}"
-        elif granularity == "3":
-            key = date.strftime("%Y-%m")
-        else:
-            print("Invalid choice.")
-            return
+    granularities = {"1": "daily", "2": "weekly", "3": "monthly"}
+    if granularity not in granularities:
+        print("Invalid choice.")
+        return
 
-        totals[key] += exp["amount"]
+    # Keys come back sorted by date
+    keys, values = get_expense_columns().period_totals(
+        granularities[granularity])
 
-    if not totals:
+    if not keys:
         print("No data to display.")
         return
 
-    # Sort by date
-    sorted_items = sorted(totals.items())
-    keys = [item[0] for item in sorted_items]
-    values = [item[1] for item in sorted_items]
+    draw_time_trend(keys, values)
+    plt.show()
+
 
-    plt.figure(figsize=(10, 6))
+def draw_time_trend(keys, values):
+    fig = plt.figure(figsize=(10, 6))
     plt.plot(keys, values, marker='o', linestyle='-', color='purple')
     plt.title("📈 Spending Trend Over Time")
     plt.xlabel("Time")
@@ -430,129 +2684,296 @@ def show_time_based_trend():
     plt.xticks(rotation=45)
     plt.grid(True, linestyle='--', alpha=0.6)
     plt.tight_layout()
-    plt.show()
-
-
-# Draw calender
-def draw_calendar(ax, year, month, fig, colorbar_container):
-    ax.clear()
-    cal = calendar.Calendar(firstweekday=6)
-    month_days = cal.monthdayscalendar(year, month)
-
-    daily_spending = defaultdict(float)
-    daily_details = defaultdict(list)
-
-    for exp in expenses:
-        date = datetime.datetime.strptime(exp["date"], "%Y-%m-%d %H:%M:%S")
-        if date.year == year and date.month == month:
-            daily_spending[date.day] += exp["amount"]
-            daily_details[date.day].append((exp["category"], exp["amount"]))
-
-    max_spending = max(daily_spending.values(), default=1)
-    cmap = plt.cm.YlOrRd
-    norm = plt.Normalize(vmin=0, vmax=max_spending)
-
-    ax.set_xlim(0, 7)
-    ax.set_ylim(0, len(month_days))
-    ax.set_xticks(range(7))
-    ax.set_xticklabels(['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'])
-    ax.set_yticks([])
-    ax.set_title(
-        f"Calendar View - {calendar.month_name[month]} {year}", fontsize=16)
-
-    rect_info = {}
-
-    for week_idx, week in enumerate(month_days):
-        for day_idx, day in enumerate(week):
+    return fig
+
+
+# Daily totals and hover text for one month, built from the date index on
+# first use and then served from calendar_cache
+@instrumented()
+def get_calendar_month(year, month):
+    ensure_loaded(*month_bounds(year, month))
+    cached = calendar_cache.get((year, month))
+    if cached is None:
+        daily_spending = defaultdict(float)
+        daily_details = defaultdict(list)
+        for exp in expenses_between(*month_bounds(year, month)):
+            daily_spending[exp.timestamp.day] += exp.amount
+            daily_details[exp.timestamp.day].append((exp.category, exp.amount))
+
+        tooltips = {}
+        for day, details in daily_details.items():
+            lines = [f"{calendar.month_name[month]} {day}:"]
+            lines += [f"  {cat}: ¥{amt:.2f}" for cat, amt in details]
+            tooltips[day] = "\n".join(lines)
+
+        cached = calendar_cache[(year, month)] = (dict(daily_spending), tooltips)
+    return cached
+
+
+# Interactive month calendar. The 6x7 grid of cells, the colorbar, the tooltip
+# and the event handlers are created once; changing month only updates the
+# cells' colours, positions and labels, and the tooltip is redrawn by blitting.
+class CalendarView:
+    WEEKS = 6
+
+    def __init__(self, fig, ax, year, month):
+        self.fig = fig
+        self.ax = ax
+        self.canvas = fig.canvas
+        self.cmap = plt.cm.YlOrRd
+        self.norm = plt.Normalize(vmin=0, vmax=1)
+        self.tooltips = {}
+        self.hovered = None
+        self.background = None
+
+        ax.set_xlim(0, 7)
+        ax.set_xticks(range(7))
+        ax.set_xticklabels(['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'])
+        ax.set_yticks([])
+
+        self.cells = []
+        for _ in range(self.WEEKS * 7):
+            rect = patches.Rectangle(
+                (0, 0), 1, 1, facecolor="white", edgecolor='gray')
+            ax.add_patch(rect)
+            day_label = ax.text(0, 0, "", ha='center', va='center',
+                                fontsize=10, weight='bold')
+            amount_label = ax.text(0, 0, "", ha='center', va='center',
+                                   fontsize=8, color='black')
+            self.cells.append((rect, day_label, amount_label))
+
+        self.mappable = plt.cm.ScalarMappable(cmap=self.cmap, norm=self.norm)
+        self.mappable.set_array([])
+        self.cbar = fig.colorbar(self.mappable, ax=ax, orientation='vertical',
+                                 fraction=0.03, pad=0.04)
+        self.cbar.set_label('Spending (¥)', fontsize=10)
+
+        # With blitting the tooltip is left out of full redraws and painted
+        # over a saved background instead
+        self.blit = self.canvas.supports_blit
+        self.annot = ax.annotate("", xy=(0, 0), xytext=(10, 10),
+                                 textcoords="offset points",
+                                 bbox=dict(boxstyle="round", fc="w"),
+                                 arrowprops=dict(arrowstyle="->"),
+                                 animated=self.blit)
+        self.annot.set_visible(False)
+
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.canvas.mpl_connect("motion_notify_event", self.on_hover)
+        self.canvas.mpl_connect("key_press_event", self.on_key)
+
+        self.show_month(year, month)
+
+    @instrumented()
+    def show_month(self, year, month):
+        self.year, self.month = year, month
+        month_days = calendar.Calendar(firstweekday=6).monthdayscalendar(
+            year, month)
+        daily_spending, tooltips = get_calendar_month(year, month)
+
+        self.norm.vmax = max(daily_spending.values(), default=1)
+        self.cbar.update_normal(self.mappable)
+        self.ax.set_ylim(0, len(month_days))
+        self.ax.set_title(
+            f"Calendar View - {calendar.month_name[month]} {year}", fontsize=16)
+
+        self.tooltips = {}
+        weeks = len(month_days)
+        for idx, (rect, day_label, amount_label) in enumerate(self.cells):
+            week_idx, day_idx = divmod(idx, 7)
+            day = month_days[week_idx][day_idx] if week_idx < weeks else 0
+            for artist in (rect, day_label, amount_label):
+                artist.set_visible(day != 0)
             if day == 0:
                 continue
+
             spending = daily_spending.get(day, 0)
-            color = cmap(norm(spending)) if spending > 0 else "white"
+            x, y = day_idx, weeks - 1 - week_idx
+            rect.set_xy((x, y))
+            rect.set_facecolor(
+                self.cmap(self.norm(spending)) if spending > 0 else "white")
+            day_label.set_position((x + 0.5, y + 0.7))
+            day_label.set_text(str(day))
+            amount_label.set_position((x + 0.5, y + 0.3))
+            amount_label.set_text(f"¥{spending:.2f}" if spending > 0 else "")
+            self.tooltips[(x, y)] = tooltips.get(day)
+
+        self.hovered = None
+        self.annot.set_visible(False)
+        self.canvas.draw_idle()
+
+    def on_draw(self, event):
+        if self.blit:
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+            self.draw_tooltip()
+
+    def draw_tooltip(self):
+        if not self.blit:
+            self.canvas.draw_idle()
+            return
+        if self.background is None:
+            return
+        self.canvas.restore_region(self.background)
+        if self.annot.get_visible():
+            self.ax.draw_artist(self.annot)
+        self.canvas.blit(self.fig.bbox)
+
+    def on_hover(self, event):
+        text = None
+        if event.inaxes == self.ax:
+            # Cells are unit squares, so the cell under the mouse is a lookup
+            text = self.tooltips.get(
+                (math.floor(event.xdata), math.floor(event.ydata)))
+
+        if text:
+            self.annot.xy = (event.xdata, event.ydata)
+            self.annot.set_text(text)
+            self.annot.set_visible(True)
+        elif self.hovered is None:
+            # Nothing was shown and nothing is to be shown
+            return
+        else:
+            self.annot.set_visible(False)
+        self.hovered = text
+        self.draw_tooltip()
 
-            x, y = day_idx, len(month_days) - 1 - week_idx
-            rect = patches.Rectangle(
-                (x, y), 1, 1, facecolor=color, edgecolor='gray')
-            ax.add_patch(rect)
-            ax.text(x + 0.5, y + 0.7, str(day), ha='center',
-                    va='center', fontsize=10, weight='bold')
-
-            if spending > 0:
-                ax.text(x + 0.5, y + 0.3, f"¥{spending:.2f}",
-                        ha='center', va='center', fontsize=8, color='black')
-
-            rect_info[(x, y)] = (day, daily_details.get(day, []))
-
-    # Remove previous colorbar if it exists
-    if colorbar_container["cbar"]:
-        colorbar_container["cbar"].remove()
-        colorbar_container["cbar"] = None
-
-    # Add new colorbar
-    sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
-    sm.set_array([])
-    colorbar_container["cbar"] = fig.colorbar(
-        sm, ax=ax, orientation='vertical', fraction=0.03, pad=0.04)
-    colorbar_container["cbar"].set_label('Spending (¥)', fontsize=10)
-
-    # Tooltip
-    annot = ax.annotate("", xy=(0, 0), xytext=(10, 10), textcoords="offset points",
-                        bbox=dict(boxstyle="round", fc="w"),
-                        arrowprops=dict(arrowstyle="->"))
-    annot.set_visible(False)
-
-    def on_hover(event):
-        if event.inaxes == ax:
-            for (x, y), (day, details) in rect_info.items():
-                if x <= event.xdata < x + 1 and y <= event.ydata < y + 1:
-                    if details:
-                        text = f"{calendar.month_name[month]} {day}:\n"
-                        for cat, amt in details:
-                            text += f"  {cat}: ¥{amt:.2f}\n"
-                        annot.xy = (event.xdata, event.ydata)
-                        annot.set_text(text.strip())
-                        annot.set_visible(True)
-                        fig.canvas.draw_idle()
-                        return
-        annot.set_visible(False)
-        fig.canvas.draw_idle()
-
-    fig.canvas.mpl_connect("motion_notify_event", on_hover)
+    def on_key(self, event):
+        year, month = self.year, self.month
+        if event.key == "right":
+            if month == 12:
+                month = 1
+                year += 1
+            else:
+                month += 1
+        elif event.key == "left":
+            if month == 1:
+                month = 12
+                year -= 1
+            else:
+                month -= 1
+        else:
+            return
+        self.show_month(year, month)
 
 
 # Calender view of expenses
+@instrumented()
 def show_calendar_view():
     now = datetime.datetime.now()
-    current_year = now.year
-    current_month = now.month
-
-    fig, ax = plt.subplots(figsize=(10, 6))
-    # Track the colorbar so we can remove it
-    colorbar_container = {"cbar": None}
+    draw_calendar(now.year, now.month)
+    plt.show()
 
-    draw_calendar(ax, current_year, current_month, fig, colorbar_container)
 
-    def on_key(event):
-        nonlocal current_year, current_month
-        if event.key == "right":
-            if current_month == 12:
-                current_month = 1
-                current_year += 1
-            else:
-                current_month += 1
-        elif event.key == "left":
-            if current_month == 1:
-                current_month = 12
-                current_year -= 1
-            else:
-                current_month -= 1
-        draw_calendar(ax, current_year, current_month, fig, colorbar_container)
-
-    fig.canvas.mpl_connect("key_press_event", on_key)
-    plt.show()
+def draw_calendar(year, month):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    # matplotlib only holds weak references to bound-method callbacks
+    fig.calendar_view = CalendarView(fig, ax, year, month)
+    return fig
+
+
+# matplotlib takes seconds to import, so it is only loaded once the
+# analytics menu is opened
+plt = None
+patches = None
+
+
+# Headless rendering picks the non-interactive Agg backend, unless pyplot is
+# already loaded with an interactive one (saving works with either)
+@instrumented()
+def load_plotting(headless=False):
+    global plt, patches
+    if plt is None:
+        if headless:
+            import matplotlib
+            matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as patches
+
+
+# Paths of charts rendered this session: (kind, format, params) ->
+# (ledger_changes at render time, path)
+rendered_charts = {}
+
+
+# Data a chart is drawn from, or None when there is nothing to draw
+def chart_data(kind, params):
+    if kind == "breakdown":
+        return storage.category_totals() or None
+    if kind == "trend":
+        ensure_loaded()
+        if not expenses:
+            return None
+        keys, values = get_expense_columns().period_totals(params["granularity"])
+        return [keys, values] if keys else None
+    if kind == "calendar":
+        daily_spending, _ = get_calendar_month(params["year"], params["month"])
+        return daily_spending
+    raise ValueError(f"Unknown chart: {kind}")
+
+
+def draw_chart(kind, data, params):
+    if kind == "breakdown":
+        return draw_category_breakdown(data)
+    if kind == "trend":
+        return draw_time_trend(*data)
+    return draw_calendar(params["year"], params["month"])
+
+
+# Render a chart to a PNG or SVG file without opening a window; returns its
+# path in CHART_CACHE_DIR. Unless the ledger changed since the last render
+# this session the earlier path is returned as is; otherwise the file is
+# named by a digest of the chart's data, so a render from any earlier
+# session with the same data is reused.
+@instrumented()
+def render_chart(kind, fmt="png", **params):
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"Unknown chart format: {fmt}")
+    session_key = (kind, fmt, tuple(sorted(params.items())))
+    rendered = rendered_charts.get(session_key)
+    if rendered is not None and rendered[0] == ledger_changes \
+            and os.path.exists(rendered[1]):
+        os.utime(rendered[1])
+        return rendered[1]
+
+    data = chart_data(kind, params)
+    if data is None:
+        raise ValueError("No expenses to chart.")
+    digest = hashlib.sha256(json.dumps(
+        [kind, params, data], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    path = os.path.join(CHART_CACHE_DIR, f"{kind}-{digest[:32]}.{fmt}")
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        load_plotting(headless=True)
+        fig = draw_chart(kind, data, params)
+        os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+        with atomic_write(path, mode="wb") as file:
+            fig.savefig(file, format=fmt)
+        plt.close(fig)
+        evict_charts()
+    rendered_charts[session_key] = (ledger_changes, path)
+    return path
+
+
+# Remove the least recently used renders until the cache fits in limit bytes
+def evict_charts(limit=CHART_CACHE_BYTES):
+    charts = []
+    for entry in os.scandir(CHART_CACHE_DIR):
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            stat = entry.stat()
+            charts.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in charts)
+    for _, size, path in sorted(charts):
+        if total <= limit:
+            break
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        total -= size
 
 
 # Analytics menu
 def analytics_menu():
+    load_plotting()
     while True:
         print("\n📊 Analytics Menu")
         print("1. 📈 Category-wise Expense Breakdown")
@@ -574,52 +2995,283 @@ def analytics_menu():
             print("Invalid option. Please try again.")
 
 
+# Output format from the file name: .csv or .ndjson/.jsonl, optionally .gz
+def export_format(filename):
+    name = filename.lower()
+    compressed = name.endswith(".gz")
+    if compressed:
+        name = name[:-3]
+    fmt = "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+    return fmt, compressed
+
+
+# Export pipeline: stream expenses from the store through optional date-range
+# (end date included) and category filters, writing them in buffered batches
+@instrumented(rows=lambda result, *args: result)
+def export_expenses(filename, start_date=None, end_date=None, categories=None):
+    fmt, compressed = export_format(filename)
+    start = end = None
+    if start_date is not None:
+        start = datetime.datetime.combine(start_date, datetime.time.min)
+    if end_date is not None:
+        end = datetime.datetime.combine(
+            end_date, datetime.time.min) + datetime.timedelta(days=1)
+
+    rows = storage.iter_expenses(start, end)
+    if categories:
+        wanted = {category.lower() for category in categories}
+        rows = (e for e in rows if e.category.lower() in wanted)
+
+    began = time.perf_counter()
+    if compressed:
+        file = gzip.open(filename, mode="wt", compresslevel=6, newline="",
+                         encoding="utf-8")
+    else:
+        file = open(filename, mode="w", newline="", encoding="utf-8",
+                    buffering=EXPORT_BUFFER_SIZE)
+    count = 0
+    with file:
+        if fmt == "csv":
+            writer = csv.writer(file)
+            writer.writerow(["date", "amount", "category"])  # Header row
+        for batch in iter_batches(rows, EXPORT_BATCH_SIZE):
+            if fmt == "csv":
+                writer.writerows([e.date, e.amount, e.category] for e in batch)
+            else:
+                file.write("".join(json.dumps(e.to_dict()) + "\n" for e in batch))
+            count += len(batch)
+
+    elapsed = time.perf_counter() - began
+    size = os.path.getsize(filename)
+    print(f"Expenses exported to {filename}")
+    if elapsed > 0:
+        print(f"{count} rows, {size:,} bytes in {elapsed:.2f}s "
+              f"({count / elapsed:,.0f} rows/sec, {size / elapsed / 1e6:.1f} MB/sec)")
+    return count
+
+
+# Split an iterable into lists of at most size items
+def iter_batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
 # Export to CSV
 def export_expenses_to_csv(filename="expenses_export.csv"):
+    ensure_loaded()
     if not expenses:
         print("No expenses to export.")
         return
 
-    with open(filename, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(["date", "amount", "category"])  # Header row
-        for expense in expenses:
-            writer.writerow(
-                [expense["date"], expense["amount"], expense["category"]])
+    export_expenses(filename)
 
-    print(f"Expenses exported to {filename}")
+
+# Ask for the optional export filters; blank answers mean no filter
+def prompt_export_filters():
+    while True:
+        try:
+            start_str = input(
+                "Start date (YYYY-MM-DD, blank for no limit): ").strip()
+            end_str = input(
+                "End date (YYYY-MM-DD, blank for no limit): ").strip()
+            start_date = datetime.datetime.strptime(
+                start_str, "%Y-%m-%d").date() if start_str else None
+            end_date = datetime.datetime.strptime(
+                end_str, "%Y-%m-%d").date() if end_str else None
+            break
+        except ValueError:
+            print('Invalid date format. Please use YYYY-MM-DD format.')
+    categories = input(
+        "Categories (comma-separated, blank for all): ").strip()
+    categories = [c.strip() for c in categories.split(",") if c.strip()]
+    return start_date, end_date, categories
+
+
+# Parse one CSV row into an expense, raising ValueError when it is unusable
+def parse_csv_row(row):
+    date, amount, category = row.get("date"), row.get("amount"), row.get("category")
+    if not date or not amount or not category:
+        raise ValueError("missing date, amount or category")
+    amount = float(amount)
+    if amount < 0:
+        raise ValueError("negative amount")
+    return Expense(amount, category, date, fields=IMPORT_FIELDS)
+
+
+# Stream a CSV file as lists of at most chunk_size valid expenses.
+# Bad rows are counted in stats and the first few described in stats["errors"].
+def iter_csv_chunks(filename, stats, chunk_size=IMPORT_CHUNK_SIZE):
+    with open(filename, mode='r', newline='', encoding='utf-8') as file:
+        reader = csv.DictReader(file)
+        chunk = []
+        for row in reader:
+            stats["rows"] += 1
+            try:
+                chunk.append(parse_csv_row(row))
+            except ValueError as error:
+                stats["invalid"] += 1
+                if stats["invalid"] <= MAX_REPORTED_ROW_ERRORS:
+                    stats["errors"].append(f"line {reader.line_num}: {error}")
+                continue
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+# Keep only the candidates the ledger does not already hold. seen and added
+# count the copies of each (date, amount, category) met and kept so far in
+# this import: a row only counts as new once the import holds more copies of
+# it than the ledger did beforehand.
+def skip_known_expenses(candidates, seen, added, stats):
+    new_expenses = []
+    for expense in candidates:
+        key = expense_key(expense)
+        seen[key] += 1
+        if seen[key] <= expense_keys[key] - added[key]:
+            stats["duplicates"] += 1
+            continue
+        added[key] += 1
+        new_expenses.append(expense)
+    return new_expenses
+
+
+def print_import_report(source, stats, added_count, elapsed):
+    for error in stats["errors"]:
+        print(f"Skipping {error}")
+    rate = stats["rows"] / elapsed if elapsed > 0 else 0
+    print(f"Expenses imported from {source}")
+    print(f"{added_count} added, {stats['duplicates']} duplicates skipped, "
+          f"{stats['invalid']} invalid rows ({stats['rows']} rows in {elapsed:.2f}s, "
+          f"{rate:,.0f} rows/sec)")
 
 
-# Import from CSV
+# Import from CSV, skipping rows the ledger already has and writing once at the end
+@instrumented(rows=lambda result, filename: len(result))
 def import_expenses_from_csv(filename):
+    # Duplicates are found against the whole ledger
+    ensure_loaded()
+    stats = {"rows": 0, "invalid": 0, "duplicates": 0, "errors": []}
+    imported_expenses = []
+    seen = Counter()
+    added = Counter()
+    start = time.perf_counter()
+
+    # Locked throughout, so duplicates are checked against other processes' writes.
+    # A file that fails partway adds nothing: the chunks already in the ledger
+    # are taken out again, as none of them reached storage.
+    with storage.locked():
+        try:
+            for chunk in iter_csv_chunks(filename, stats):
+                new_expenses = skip_known_expenses(chunk, seen, added, stats)
+                add_to_ledger(new_expenses)
+                imported_expenses.extend(new_expenses)
+        except FileNotFoundError:
+            print(f"File '{filename}' not found.")
+            return []
+        except (OSError, UnicodeDecodeError, csv.Error) as error:
+            remove_from_ledger(imported_expenses)
+            print(f"Could not read '{filename}': {error}. Nothing was imported.")
+            return []
+        except BaseException:
+            remove_from_ledger(imported_expenses)
+            raise
+
+        storage.add_expenses(imported_expenses)
+    print_import_report(filename, stats, len(imported_expenses),
+                        time.perf_counter() - start)
+    return imported_expenses
+
+
+# Worker for bulk imports: parse and validate one file in a separate process.
+# Rows come back as plain tuples, and a file that cannot be read is reported
+# rather than raised so it does not abort the batch.
+def parse_csv_file(filename):
+    stats = {"rows": 0, "invalid": 0, "errors": [], "failed": False}
+    rows = []
     try:
-        with open(filename, mode='r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            imported_expenses = []
-            for row in reader:
-                imported_expenses.append({
-                    'date': row['date'],
-                    'amount': float(row['amount']),
-                    'category': row['category']
-                })
-            print(f"Expenses imported from {filename}")
-            return imported_expenses
-    except FileNotFoundError:
-        print(f"File '{filename}' not found.")
+        for chunk in iter_csv_chunks(filename, stats):
+            rows.extend((e.amount, e.category, e.date, e.timestamp)
+                        for e in chunk)
+    except (OSError, UnicodeDecodeError, csv.Error) as error:
+        stats["errors"].append(f"could not read file: {error}")
+        stats["failed"] = True
+        rows = []
+    return filename, rows, stats
+
+
+# Files named by a directory (every *.csv in it) or a glob pattern
+def find_import_files(source):
+    if os.path.isdir(source):
+        source = os.path.join(source, "*.csv")
+    return sorted(glob.glob(source))
+
+
+# Import many CSV files at once: parse them in parallel, merge the rows in
+# date order and write them with a single storage call
+@instrumented(rows=lambda result, *args: len(result))
+def bulk_import_expenses(source, max_workers=None):
+    filenames = find_import_files(source)
+    if not filenames:
+        print(f"No CSV files found for '{source}'.")
         return []
 
+    ensure_loaded()
+    start = time.perf_counter()
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(parse_csv_file, filename): filename
+                   for filename in filenames}
+        for future in concurrent.futures.as_completed(futures):
+            filename = futures[future]
+            try:
+                results[filename] = future.result()[1:]
+            except Exception as error:
+                results[filename] = ([], {"rows": 0, "invalid": 0, "failed": True,
+                                          "errors": [f"worker failed: {error}"]})
+
+    totals = {"rows": 0, "invalid": 0, "duplicates": 0, "errors": []}
+    candidates = []
+    print(f"\n📥 Bulk import of {len(filenames)} files")
+    for filename in filenames:
+        rows, stats = results[filename]
+        totals["rows"] += stats["rows"]
+        totals["invalid"] += stats["invalid"]
+        status = "❌ failed" if stats["failed"] else f"{len(rows)} valid rows"
+        print(f"{filename}: {status}, {stats['invalid']} invalid")
+        for error in stats["errors"]:
+            print(f"    {error}")
+        candidates.extend(
+            Expense(amount, category, date, timestamp=timestamp,
+                    fields=IMPORT_FIELDS)
+            for amount, category, date, timestamp in rows)
+
+    candidates.sort(key=lambda e: e.timestamp)
+    with storage.locked():
+        imported_expenses = skip_known_expenses(candidates, Counter(), Counter(),
+                                                totals)
+        record_expenses(imported_expenses)
+
+    print_import_report(f"{len(filenames)} files", totals,
+                        len(imported_expenses), time.perf_counter() - start)
+    return imported_expenses
+
 
 # Category Suggestion
 def validate_or_suggest_category(input_category):
-    known_categories = list(monthly_budget.keys()) + \
-        [e["category"] for e in expenses]
-    known_categories = list(set(known_categories))
+    # Same name up to case and spacing: use the known spelling
+    known = category_registry.lookup(input_category)
+    if known:
+        return known
 
-    close_matches = difflib.get_close_matches(
-        input_category, known_categories, n=1, cutoff=0.7)
+    suggested = category_registry.suggest(input_category)
 
-    if close_matches:
-        suggested = close_matches[0]
+    if suggested:
         confirm = input(f'Did you mean "{suggested}"? (Y/N): ').strip().lower()
         if confirm == "y":
             return suggested
@@ -629,6 +3281,8 @@ def validate_or_suggest_category(input_category):
             if confirm_new == 'y':
                 budget = prompt_for_budget(input_category)
                 monthly_budget[input_category] = budget
+                save_category_budgets()
+                category_registry.pin(input_category)
                 return input_category
             else:
                 print("Category not accepted.")
@@ -639,6 +3293,8 @@ def validate_or_suggest_category(input_category):
         if confirm_new == 'y':
             budget = prompt_for_budget(input_category)
             monthly_budget[input_category] = budget
+            save_category_budgets()
+            category_registry.pin(input_category)
             return input_category
         else:
             print("Category not accepted.")
@@ -659,9 +3315,286 @@ def prompt_for_budget(category):
             print("Invalid budget amount. Try again.")
 
 
-def main():
+# Non-interactive category check: the known spelling, or the name as given
+# unless strict, in which case unknown categories are rejected
+def resolve_category(name, strict=False):
+    name = str(name or "").strip()
+    if not name:
+        raise ValueError("missing category")
+    known = category_registry.lookup(name)
+    if known:
+        return known
+    if strict:
+        suggested = category_registry.suggest(name)
+        hint = f' (did you mean "{suggested}"?)' if suggested else ""
+        raise ValueError(f'unknown category "{name}"{hint}')
+    return name
+
+
+def cli_date(text):
+    return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def cli_month(text):
+    return datetime.datetime.strptime(text, "%Y-%m")
+
+
+# Command line for scripts and cron jobs, e.g.
+#   python main.py add 120 Food
+#   python main.py bulk-add --format ndjson < expenses.ndjson
+#   python main.py --json summary --month 2025-05
+#   python main.py --profile timing,cprofile summary && python main.py profile
+#   EXPENSE_STORAGE=binary python main.py convert json
+#   python main.py chart calendar --month 2025-05 --format svg
+def build_cli_parser():
+    parser = argparse.ArgumentParser(
+        description="Smart expense tracker. Run without arguments for the menu.")
+    parser.add_argument("--json", action="store_true",
+                        help="print the result as JSON; messages go to stderr")
+    parser.add_argument("--profile", type=cli_profile_modes, metavar="MODES",
+                        help="instrument this run: timing, cprofile and/or "
+                             "tracemalloc, comma separated")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add one expense")
+    add.add_argument("amount")
+    add.add_argument("category")
+    add.add_argument("--date", help="YYYY-MM-DD HH:MM:SS (default: now)")
+    add.add_argument("--strict", action="store_true",
+                     help="reject categories that are not already known")
+
+    bulk = commands.add_parser(
+        "bulk-add", help="add expenses read from stdin in one batch")
+    bulk.add_argument("--format", choices=("csv", "ndjson"), default="csv",
+                      help="csv rows are amount,category[,date]; ndjson objects "
+                           "have amount, category and optionally date")
+    bulk.add_argument("--strict", action="store_true",
+                      help="reject categories that are not already known")
+
+    summary = commands.add_parser("summary", help="monthly budget summary")
+    summary.add_argument("--month", type=cli_month, help="YYYY-MM (default: this month)")
+
+    filter_cmd = commands.add_parser("filter", help="list expenses in a period")
+    filter_cmd.add_argument("period", choices=("week", "month", "range"))
+    filter_cmd.add_argument("--start", type=cli_date, help="YYYY-MM-DD, for range")
+    filter_cmd.add_argument("--end", type=cli_date, help="YYYY-MM-DD, for range")
+
+    export = commands.add_parser("export", help="export expenses to a file")
+    export.add_argument("filename", nargs="?", default="expenses_export.csv",
+                        help=".csv, .ndjson or either with .gz")
+    export.add_argument("--start", type=cli_date, help="YYYY-MM-DD")
+    export.add_argument("--end", type=cli_date, help="YYYY-MM-DD, inclusive")
+    export.add_argument("--category", action="append",
+                        help="only this category; repeat for several")
+
+    import_cmd = commands.add_parser(
+        "import", help="import a CSV file, a directory of them or a glob")
+    import_cmd.add_argument("source")
+    import_cmd.add_argument("--workers", type=int,
+                            help="worker processes for directories and globs")
+
+    chart = commands.add_parser(
+        "chart", help="render a chart to PNG or SVG without opening a window")
+    chart.add_argument("kind", choices=CHART_KINDS)
+    chart.add_argument("--granularity", choices=("daily", "weekly", "monthly"),
+                       default="monthly", help="for trend (default: monthly)")
+    chart.add_argument("--month", type=cli_month,
+                       help="YYYY-MM, for calendar (default: this month)")
+    chart.add_argument("--format", choices=CHART_FORMATS, default="png")
+    chart.add_argument("--output", help="where to write the chart "
+                                        "(default: KIND.FORMAT)")
+
+    convert = commands.add_parser(
+        "convert", help="write the ledger as another backend's snapshot")
+    convert.add_argument("format", choices=("json", "binary", "partitioned"),
+                         help=f"json: {EXPENSES_FILE}, binary: {LEDGER_BINARY_FILE}, "
+                              f"partitioned: {PARTITIONS_DIR}/")
+
+    profile = commands.add_parser(
+        "profile", help="show the top offenders of the last profiled session")
+    profile.add_argument("--limit", type=int, default=PROFILE_REPORT_LIMIT)
+    return parser
+
+
+def cli_profile_modes(text):
+    try:
+        return profile_modes(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def cli_add(args):
+    category = resolve_category(args.category, args.strict)
+    expense = new_expense(args.amount, category, args.date)
+    record_expenses([expense])
+    print(f"Added expense: {expense.amount} in category: {category} on {expense.date}")
+    return {"added": [expense.to_dict()]}
+
+
+# One stdin row as (amount, category, date)
+def parse_bulk_row(row, fmt):
+    if fmt == "ndjson":
+        data = json.loads(row)
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        return data.get("amount"), data.get("category"), data.get("date")
+    if len(row) not in (2, 3):
+        raise ValueError("expected amount,category[,date]")
+    return row[0], row[1], row[2] if len(row) == 3 else None
+
+
+# Every valid row is added in one batch and written to storage once
+def cli_bulk_add(args):
+    if args.format == "csv":
+        rows = (row for row in csv.reader(sys.stdin) if row)
+    else:
+        rows = (line for line in sys.stdin if line.strip())
+
+    stats = {"rows": 0, "invalid": 0, "errors": []}
+    batch = []
+    for number, row in enumerate(rows, start=1):
+        stats["rows"] += 1
+        try:
+            amount, category, date = parse_bulk_row(row, args.format)
+            batch.append(new_expense(amount, resolve_category(category, args.strict),
+                                     date))
+        except ValueError as error:
+            stats["invalid"] += 1
+            if stats["invalid"] <= MAX_REPORTED_ROW_ERRORS:
+                stats["errors"].append(f"row {number}: {error}")
+
+    record_expenses(batch)
+    print(f"Added {len(batch)} of {stats['rows']} expenses, "
+          f"{stats['invalid']} rows rejected")
+    for error in stats["errors"]:
+        print(f"    {error}")
+    return {"added": len(batch), "rejected": stats["invalid"],
+            "errors": stats["errors"]}
+
+
+def cli_summary(args):
+    year, month = (args.month.year, args.month.month) if args.month else (None, None)
+    summary = monthly_summary(year, month)
+    if not args.json:
+        print_monthly_summary(summary)
+    return {"categories": summary}
+
+
+def cli_filter(args):
+    if args.period == "range" and (args.start is None or args.end is None):
+        raise ValueError("range needs --start and --end")
+    label, filtered = query_expenses_by_date(args.period, args.start, args.end)
+    if not args.json:
+        print_filtered_expenses(label, filtered)
+    return {"label": label, "expenses": [e.to_dict() for e in filtered]}
+
+
+def cli_export(args):
+    rows = export_expenses(args.filename, args.start, args.end, args.category)
+    return {"file": args.filename, "rows": rows}
+
+
+def cli_import(args):
+    if os.path.isfile(args.source):
+        imported = import_expenses_from_csv(args.source)
+    else:
+        imported = bulk_import_expenses(args.source, args.workers)
+    return {"imported": len(imported)}
+
+
+def cli_chart(args):
+    params = {}
+    if args.kind == "trend":
+        params["granularity"] = args.granularity
+    elif args.kind == "calendar":
+        month = args.month or datetime.datetime.now()
+        params.update(year=month.year, month=month.month)
+    path = render_chart(args.kind, args.format, **params)
+    output = args.output or f"{args.kind}.{args.format}"
+    shutil.copyfile(path, output)
+    print(f"Chart written to {output}")
+    return {"file": output, "cached": path}
+
+
+# Lossless in both directions; the target's journal is emptied, since the
+# snapshot already holds everything in it
+def cli_convert(args):
+    ensure_loaded()
+    target = STORAGE_BACKENDS[args.format]()
+    target.rewrite_snapshot(list(expenses.values()))
+    print(f"Wrote {len(expenses)} expenses to {target.snapshot_file}")
+    return {"file": target.snapshot_file, "expenses": len(expenses)}
+
+
+def cli_profile(args):
+    try:
+        with open(PROFILE_FILE, mode="r", encoding="utf-8") as file:
+            report = json.load(file)
+    except FileNotFoundError:
+        raise ValueError(f"no profile yet; run with {PROFILE_ENV}=timing or "
+                         f"--profile timing first")
+    if not args.json:
+        print_profile_report(report, args.limit)
+    return report
+
+
+CLI_COMMANDS = {
+    "add": cli_add,
+    "bulk-add": cli_bulk_add,
+    "summary": cli_summary,
+    "filter": cli_filter,
+    "export": cli_export,
+    "import": cli_import,
+    "chart": cli_chart,
+    "convert": cli_convert,
+    "profile": cli_profile,
+}
+# Commands that never touch the ledger, so skip loading it
+CLI_COMMANDS_WITHOUT_LEDGER = {"profile"}
+
+
+# Run one command with a single load of the ledger; returns the exit status
+def run_cli(argv):
+    global expenses
+    args = build_cli_parser().parse_args(argv)
+    result_file = sys.stdout
+    # In JSON mode the usual messages go to stderr so stdout stays parseable
+    messages = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    if args.profile:
+        start_profiling(args.profile)
+    with messages:
+        if args.command not in CLI_COMMANDS_WITHOUT_LEDGER:
+            expenses = load_expenses()
+            rebuild_indexes()
+        try:
+            # Commands that change the ledger report the alerts they raised
+            with budget_alerts.collecting() as alerts:
+                result = CLI_COMMANDS[args.command](args)
+                budget_alerts.flush()
+            if alerts:
+                result["alerts"] = alerts
+            status = 0
+        except ValueError as error:
+            print(f"Error: {error}", file=sys.stderr)
+            result, status = {"error": str(error)}, 1
+        finally:
+            if storage is not None:
+                storage.close(compact=False)
+
+    if args.json:
+        json.dump(result, result_file, ensure_ascii=False)
+        result_file.write("\n")
+    return status
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_cli(argv)
+
     global expenses
     expenses = load_expenses()
+    rebuild_indexes()
     while True:
         print("\n1. Add an Expense")
         print("2. Show Expenses")
@@ -671,6 +3604,7 @@ def main():
         print("6. Export / Import (CSV)")
         print("7. Edit an Expense")
         print("8. Delete an Expense")
+        print("9. Restore Deleted Expenses")
         print("0. Exit")
         try:
             choice = input("Choose an option: ")
@@ -694,6 +3628,7 @@ def main():
         elif choice == "6":
             print("1. Export")
             print("2. Import")
+            print("3. Bulk Import (directory or glob of CSV files)")
             try:
                 choice = input("Choose an option: ")
             except ValueError:
@@ -701,28 +3636,46 @@ def main():
                 continue
             if choice == "1":
                 filename = input(
-                    "Enter filename to export (default: expenses_export.csv): ").strip()
-                export_expenses_to_csv(filename or "expenses_export.csv")
+                    "Enter filename to export, .csv, .ndjson or either with .gz "
+                    "(default: expenses_export.csv): ").strip()
+                start_date, end_date, categories = prompt_export_filters()
+                if storage.is_empty():
+                    print("No expenses to export.")
+                else:
+                    export_expenses(filename or "expenses_export.csv",
+                                    start_date, end_date, categories)
             elif choice == "2":
                 filename = input(
                     "Enter filename to import (default: expenses_import.csv): ").strip()
-                expenses += import_expenses_from_csv(
-                    filename or "expenses_export.csv")
-                save_expenses()
+                import_expenses_from_csv(filename or "expenses_export.csv")
+            elif choice == "3":
+                source = input(
+                    "Enter a directory or glob pattern (e.g. statements/*.csv): ").strip()
+                if source:
+                    bulk_import_expenses(source)
 
         elif choice == "7":
             edit_expense()
         elif choice == "8":
             delete_expense()
+        elif choice == "9":
+            restore_deleted_expense()
         elif choice == "0":
+            storage.close()
             break
         else:
             print("Invalid choice, please try again.")
+        budget_alerts.flush()
 
 
-expenses = []
-monthly_budget = load_category_budgets()
+start_profiling(env_profile_modes())
+# The ledger: expenses keyed by id, in the order they were recorded
+expenses = {}
+# Opened by open_ledger when the ledger is first loaded
+storage = None
+monthly_budget = {}
+budget_alerts = open_budget_alerts()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import signal
+import sys
+import urllib.parse
+
+import main
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 16 << 20
+MAX_HEADER_LINES = 100
+# Most expenses the writer records in one locked write; requests queued
+# beyond that wait for the next batch
+MAX_WRITE_BATCH = 10000
+# Seconds between attempts to take the storage lock while another process
+# holds it, doubling up to the maximum
+LOCK_RETRY_DELAY = 0.005
+LOCK_RETRY_MAX_DELAY = 0.2
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+# A request that cannot be served, answered with {"error": message}
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Hold the storage write lock, waiting for it on the event loop rather than
+# blocking it while another process (a cron bulk-add, an interactive import)
+# has it; a failed write is rolled back where the backend can
+@contextlib.asynccontextmanager
+async def storage_lock():
+    delay = LOCK_RETRY_DELAY
+    while not main.storage.try_lock():
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, LOCK_RETRY_MAX_DELAY)
+    try:
+        yield
+    except BaseException:
+        main.storage.release_lock(commit=False)
+        raise
+    main.storage.release_lock()
+
+
+# Records the expenses of every request queued while the previous write was
+# running as one locked write. The writer is the only task that writes the
+# ledger, and once it has the lock it writes without yielding to the event
+# loop, so reads always see whole batches and never wait on other processes
+class BatchWriter:
+    def __init__(self, max_batch=MAX_WRITE_BATCH):
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.written = 0
+
+    # Wait for new_expenses to be recorded; returns the budget alerts their
+    # categories raised
+    async def submit(self, new_expenses):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((new_expenses, future))
+        return await future
+
+    def take_batch(self, first):
+        pending, size = [first], len(first[0])
+        while size < self.max_batch and not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+            size += len(pending[-1][0])
+        return pending
+
+    async def run(self):
+        while True:
+            pending = self.take_batch(await self.queue.get())
+            batch = [expense for new_expenses, _ in pending for expense in new_expenses]
+            try:
+                async with storage_lock():
+                    with main.budget_alerts.collecting() as alerts:
+                        main.record_expenses(batch)
+                        main.budget_alerts.flush()
+            except Exception as error:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.batches += 1
+            self.written += len(batch)
+            for new_expenses, future in pending:
+                categories = {expense.category.lower() for expense in new_expenses}
+                if not future.done():
+                    future.set_result([alert for alert in alerts
+                                       if alert["category"].lower() in categories])
+
+
+# One expense from a JSON object, raising ValueError when unusable
+def expense_from_json(data, strict=False):
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    return main.new_expense(data.get("amount"),
+                            main.resolve_category(data.get("category"), strict),
+                            data.get("date"))
+
+
+def query_flag(query, name):
+    return query.get(name, "").lower() in ("1", "true", "yes")
+
+
+def query_date(query, name):
+    try:
+        return main.cli_date(query[name]) if name in query else None
+    except ValueError:
+        raise ValueError(f"invalid {name}: {query[name]!r}, expected YYYY-MM-DD") from None
+
+
+async def add_expense(writer, query, body):
+    expense = expense_from_json(body, query_flag(query, "strict"))
+    alerts = await writer.submit([expense])
+    return 201, {"added": [expense.to_dict()], "alerts": alerts}
+
+
+# Every valid row is added as part of one batch, as with the bulk-add command
+async def bulk_add(writer, query, body):
+    rows = body.get("expenses") if isinstance(body, dict) else body
+    if not isinstance(rows, list):
+        raise ValueError("expected a list of expenses")
+    strict = query_flag(query, "strict")
+    batch, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        try:
+            batch.append(expense_from_json(row, strict))
+        except ValueError as error:
+            errors.append(f"row {number}: {error}")
+    alerts = await writer.submit(batch) if batch else []
+    return 201, {"added": len(batch), "rejected": len(errors),
+                 "errors": errors[:main.MAX_REPORTED_ROW_ERRORS], "alerts": alerts}
+
+
+# ?start=YYYY-MM-DD&end=YYYY-MM-DD, both included, or ?period=week|month
+async def query_expenses(writer, query, body):
+    start, end = query_date(query, "start"), query_date(query, "end")
+    period = query.get("period", "range" if start or end else "month")
+    if period not in ("week", "month", "range"):
+        raise ValueError(f"invalid period: {period!r}")
+    if period == "range" and (start is None or end is None):
+        raise ValueError("range needs start and end")
+    label, filtered = main.query_expenses_by_date(period, start, end)
+    return 200, {"label": label, "expenses": [e.to_dict() for e in filtered]}
+
+
+# ?month=YYYY-MM, the current month by default
+async def summary(writer, query, body):
+    try:
+        month = main.cli_month(query["month"]) if "month" in query else None
+    except ValueError:
+        raise ValueError(f"invalid month: {query['month']!r}, expected YYYY-MM") from None
+    year, month = (month.year, month.month) if month else (None, None)
+    return 200, {"categories": main.monthly_summary(year, month)}
+
+
+async def breakdown(writer, query, body):
+    return 200, {"categories": main.storage.category_totals()}
+
+
+async def stats(writer, query, body):
+    return 200, {"expenses": len(main.expenses), "batches": writer.batches,
+                 "written": writer.written, "queued": writer.queue.qsize()}
+
+
+ROUTES = {
+    ("POST", "/expenses"): add_expense,
+    ("POST", "/expenses/bulk"): bulk_add,
+    ("GET", "/expenses"): query_expenses,
+    ("GET", "/summary"): summary,
+    ("GET", "/breakdown"): breakdown,
+    ("GET", "/stats"): stats,
+}
+
+
+# (method, path, query, headers, body) of the next request on the connection,
+# or None once the client has closed it
+async def read_request(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "malformed request line") from None
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HTTPError(400, "too many headers")
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "invalid Content-Length") from None
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"body over {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    url = urllib.parse.urlsplit(target)
+    query = dict(urllib.parse.parse_qsl(url.query))
+    return method.upper(), url.path.rstrip("/") or "/", query, headers, body
+
+
+async def dispatch(writer, method, path, query, body):
+    handler = ROUTES.get((method, path))
+    if handler is None:
+        if any(route_path == path for _, route_path in ROUTES):
+            raise HTTPError(405, f"{method} not allowed on {path}")
+        raise HTTPError(404, f"no such endpoint: {path}")
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        raise HTTPError(400, "body is not valid JSON") from None
+    # Reads see what other processes wrote since the last request; writes
+    # merge it when the writer takes the lock
+    if method == "GET":
+        main.refresh_ledger()
+    try:
+        return await handler(writer, query, data)
+    except ValueError as error:
+        raise HTTPError(400, str(error)) from None
+
+
+def write_response(stream, status, result, keep_alive):
+    payload = json.dumps(result, ensure_ascii=False).encode("utf-8")
+    stream.write(
+        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        .encode("latin-1") + payload)
+
+
+# Serve requests on one connection until either side closes it
+async def handle_connection(writer, reader, stream):
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, result = await dispatch(writer, method, path, query, body)
+            except HTTPError as error:
+                status, result = error.status, {"error": str(error)}
+            except asyncio.IncompleteReadError:
+                break
+            except Exception as error:
+                print(f"Error serving request: {error!r}", file=sys.stderr)
+                status, result = 500, {"error": "internal error"}
+            write_response(stream, status, result, keep_alive)
+            await stream.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        stream.close()
+
+
+# Serve until SIGINT or SIGTERM; a batch being written always completes, as
+# the writer only yields between batches
+async def serve(host, port):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(signum, stop.set)
+
+    writer = BatchWriter()
+    writer_task = asyncio.create_task(writer.run())
+    server = await asyncio.start_server(
+        lambda reader, stream: handle_connection(writer, reader, stream), host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Serving {len(main.expenses)} expenses on http://{address[0]}:{address[1]}",
+          flush=True)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        writer_task.cancel()
+
+
+def run_server(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local HTTP/JSON API over the expense ledger")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    main.expenses = main.load_expenses()
+    main.rebuild_indexes()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        main.storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_server())
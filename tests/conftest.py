@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+# Drop the open backend and load the ledger again, as a new process would
+def reopen():
+    if main.storage is not None:
+        main.storage.close(compact=False)
+    main.storage = None
+    main.monthly_budget.clear()
+    main.expenses = main.load_expenses()
+    main.rebuild_indexes()
+
+
+# Run each test in an empty working directory on the backend it asks for
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def open_backend(backend="json"):
+        monkeypatch.setenv("EXPENSE_STORAGE", backend)
+        reopen()
+
+    yield open_backend
+    if main.storage is not None:
+        main.storage.close(compact=False)
+    main.storage = None
+    main.monthly_budget.clear()
+    main.expenses = {}
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import main
+
+
+# Run code in a fresh interpreter that imports main with extra environment
+def run_with_env(tmp_path, code, **env):
+    return subprocess.run(
+        [sys.executable, "-c", f"import main; {code}"], cwd=tmp_path, text=True,
+        capture_output=True, env=dict(os.environ, **env,
+                                      PYTHONPATH=os.path.dirname(main.__file__)))
+
+
+def test_bad_profile_env_warns_instead_of_failing_import(tmp_path):
+    result = run_with_env(tmp_path, "pass", EXPENSE_PROFILE="timing,bogus")
+    assert result.returncode == 0
+    assert "ignoring EXPENSE_PROFILE" in result.stderr
+    assert not (tmp_path / main.PROFILE_FILE).exists()
+
+
+def test_bad_alert_levels_env_falls_back_to_defaults(tmp_path):
+    result = run_with_env(tmp_path, "print(main.budget_alerts.levels)",
+                          EXPENSE_ALERT_LEVELS="0.9,lots")
+    assert result.returncode == 0
+    assert "ignoring EXPENSE_ALERT_LEVELS" in result.stderr
+    assert result.stdout.strip() == str(main.BUDGET_ALERT_LEVELS)
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+import server
+from conftest import reopen
+
+
+def add(amount, category="Food", date="2025-01-01 10:00:00"):
+    expense = main.new_expense(amount, category, date)
+    main.record_expenses([expense])
+    return expense
+
+
+def ledger_dicts():
+    return [expense.to_dict() for expense in main.expenses.values()]
+
+
+@pytest.mark.parametrize("backend", ["json", "binary", "partitioned", "sqlite"])
+def test_round_trip(ledger, backend):
+    ledger(backend)
+    first, second, _ = [add(amount, date=f"2025-0{amount}-01 10:00:00")
+                        for amount in (1, 2, 3)]
+    with main.storage.locked():
+        main.unindex_expense(first)
+        first.update({"amount": 1.5, "category": "Bills"})
+        main.index_expense(first)
+        main.storage.update_expense(first)
+        main.remove_from_ledger([second])
+        main.storage.delete_expenses([second])
+    before = sorted(ledger_dicts(), key=lambda data: data["id"])
+    reopen()
+    main.ensure_loaded()
+    assert sorted(ledger_dicts(), key=lambda data: data["id"]) == before
+    assert [data["amount"] for data in before] == [1.5, 3]
+
+
+def test_journal_recovers_from_partial_last_line(ledger):
+    ledger("json")
+    add(1)
+    with open(main.JOURNAL_FILE, mode="ab") as file:
+        file.write(b'{"op": "add", "exp')
+    reopen()
+    add(2)
+    add(3)
+    reopen()
+    assert [e["amount"] for e in ledger_dicts()] == [1, 2, 3]
+    assert list(main.expenses) == [1, 2, 3]
+
+
+def test_deleted_log_recovers_from_partial_last_line(ledger):
+    ledger("json")
+    first, second = add(1), add(2)
+    main.storage.log_deleted([first])
+    with open(main.DELETED_LOG_FILE, mode="a", encoding="utf-8") as file:
+        file.write('{"entry": "1.')
+    main.storage.log_deleted([second])
+    reopen()
+    assert [entry["expense"].amount for entry in main.storage.load_deleted()] == [1, 2]
+
+
+def test_compaction_threshold_scales_with_snapshot(ledger):
+    ledger("json")
+    main.storage.rewrite_snapshot([main.new_expense(1, "Food", "2025-01-01 10:00:00")
+                                   for _ in range(4000)])
+    reopen()
+    main.record_expenses([main.new_expense(2, "Food") for _ in range(600)])
+    assert main.storage.journal_records == 600
+    main.record_expenses([main.new_expense(3, "Food") for _ in range(500)])
+    assert main.storage.journal_records == 0
+    reopen()
+    assert len(main.expenses) == 5100
+
+
+def test_convert_partitioned_over_existing_directory(ledger, monkeypatch):
+    ledger("json")
+    january = add(1, date="2025-01-05 10:00:00")
+    add(2, date="2025-02-05 10:00:00")
+    assert main.run_cli(["convert", "partitioned"]) == 0
+
+    main.remove_from_ledger([january])
+    main.storage.delete_expenses([january])
+    add(3, date="2025-03-05 10:00:00")
+    assert main.run_cli(["convert", "partitioned"]) == 0
+    assert sorted(os.listdir(main.PARTITIONS_DIR)) == [
+        "2025-02.json", "2025-03.json", main.PARTITION_MANIFEST]
+
+    monkeypatch.setenv("EXPENSE_STORAGE", "partitioned")
+    reopen()
+    added = add(4, date="2025-01-06 10:00:00")
+    assert added.id == 4
+    reopen()
+    label, rows = main.query_expenses_by_date(
+        "range", main.cli_date("2025-01-01"), main.cli_date("2025-12-31"))
+    assert [(e.id, e.amount) for e in rows] == [(4, 4), (2, 2), (3, 3)]
+
+
+@pytest.mark.parametrize("backend", ["json", "binary", "partitioned", "sqlite"])
+def test_server_reads_see_other_processes_writes(ledger, backend):
+    ledger(backend)
+    add(1, date="2025-01-01 10:00:00")
+    subprocess.run([sys.executable, main.__file__, "add", "2", "Food",
+                    "--date", "2025-01-02 10:00:00"], check=True, capture_output=True)
+    status, result = asyncio.run(server.dispatch(
+        None, "GET", "/expenses", {"start": "2025-01-01", "end": "2025-01-31"}, b""))
+    assert status == 200
+    assert sorted(row["amount"] for row in result["expenses"]) == [1, 2]
+    _, result = asyncio.run(server.dispatch(
+        server.BatchWriter(), "GET", "/stats", {}, b""))
+    assert result["expenses"] == 2